@@ -6,3 +6,14 @@ class ChatConfig(AppConfig):
     # package will be renamed to 'api' but keep label 'chat' to preserve migrations
     name = 'api'
     label = 'chat'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.models.signals import post_delete, post_save
+        from .user_cache import invalidate_saved_user
+        from .user_search import discard_saved_user
+
+        post_save.connect(invalidate_saved_user, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(invalidate_saved_user, sender=settings.AUTH_USER_MODEL)
+        post_save.connect(discard_saved_user, sender=settings.AUTH_USER_MODEL)
+        post_delete.connect(discard_saved_user, sender=settings.AUTH_USER_MODEL)
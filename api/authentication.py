@@ -0,0 +1,15 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .user_cache import get_cached_user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reads the token's user through the shared user cache.
+
+    The token is still validated on every request; the user row is loaded and
+    checked (active, revoked) by JWTAuthentication only on a cache miss.
+    """
+
+    def get_user(self, validated_token):
+        return get_cached_user(validated_token,
+                               lambda: super(CachedJWTAuthentication, self).get_user(validated_token))
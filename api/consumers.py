@@ -3,29 +3,94 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.utils import timezone
 from django.db import transaction
-from django.core.exceptions import ValidationError
-from .models import Chat, Message, SwapanzaSession
+from django.core.exceptions import PermissionDenied, ValidationError
+from .models import Chat, ChatMembership, Message, SwapanzaParticipant, SwapanzaSession
+from .message_buffer import buffer_message, get_recent_messages
+from .serializers import MessageSerializer, UserSummarySerializer
+from .swapanza_state import SWAPANZA_MESSAGE_LIMIT, get_swapanza_store
+from .tasks import schedule_stale_invite_cleanup, schedule_swapanza_expiry
+from .user_state import (collect_state, publish_swapanza_state, publish_unread_cleared,
+                         publish_unread_counts, send_state_async)
+from .wire import MSGPACK_SUBPROTOCOL, decode_msgpack, encode_msgpack, wrap_msgpack
 from django.contrib.auth import get_user_model
 User = get_user_model()
-from rest_framework_simplejwt.tokens import AccessToken
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 import asyncio
 import logging
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from django.contrib.auth.models import AnonymousUser
 import traceback
 from asgiref.sync import sync_to_async
 logger = logging.getLogger(__name__)
 
+# Most messages sent in one chat.replay frame; clients ask again for the rest
+REPLAY_LIMIT = 200
 
-class ChatConsumer(AsyncWebsocketConsumer):
+
+def chat_access_code(chat_id, user_id):
+    """None if the user is a participant of the chat, else the close code to refuse it with:
+    4004 for an unknown chat, 4003 for someone else's.
+    """
+    is_participant = Chat.objects.filter(id=chat_id).annotate(is_participant=Exists(
+        Chat.participants.through.objects.filter(chat_id=OuterRef('id'), user_id=user_id))
+    ).values_list('is_participant', flat=True).first()
+    if is_participant is None:
+        return 4004
+    return None if is_participant else 4003
+
+
+class WireProtocolMixin:
+    """JSON text frames, or compact msgpack ones for clients offering MSGPACK_SUBPROTOCOL.
+
+    Consumers keep building and parsing JSON text; frames are translated
+    only here, at the edge of msgpack sockets. Broadcast frames carry both
+    encodings, made once for the group, and ``frame_data`` picks one. See
+    api.wire for the format.
+    """
+    subprotocol = None
+
+    async def websocket_connect(self, message):
+        if MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', ()):
+            self.subprotocol = MSGPACK_SUBPROTOCOL
+        await super().websocket_connect(message)
+
+    async def accept(self, subprotocol=None, headers=None):
+        await super().accept(subprotocol or self.subprotocol, headers)
+
+    async def websocket_receive(self, message):
+        if self.subprotocol and message.get('bytes') is not None:
+            try:
+                frame = decode_msgpack(message['bytes'])
+            except Exception:
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': 'Invalid msgpack frame'
+                }))
+                return
+            message = {'type': message['type'], 'text': json.dumps(frame)}
+        await super().websocket_receive(message)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if self.subprotocol and text_data is not None:
+            text_data, bytes_data = None, encode_msgpack(json.loads(text_data))
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    def frame_data(self, event):
+        """``(text_data, bytes_data)`` of a broadcast event for this socket's protocol"""
+        if self.subprotocol and event.get('bytes') is not None:
+            return None, event['bytes']
+        return event['text'], None
+
+
+class ChatConsumer(WireProtocolMixin, AsyncWebsocketConsumer):
 
     async def connect(self):
         """Connect to WebSocket and set up user session"""
         self.chat_id = self.scope['url_route']['kwargs']['chat_id']
         self.chat_group_name = f'chat_{self.chat_id}'
         self.user = self.scope.get('user', None)
+        self.cached_chat = None
+        self.background_tasks = set()
 
         logger.info(f"WebSocket CONNECT attempt: User {getattr(self.user, 'username', 'anonymous')} (ID: {getattr(self.user, 'id', 'none')}) to chat {self.chat_id}")
         
@@ -35,53 +100,51 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         logger.info(f"WebSocket authentication successful for user {self.user.username}")
-        
+
+        # Before joining the group, so no chat frame reaches an outsider
+        close_code = await self.check_access()
+        if close_code is not None:
+            logger.warning(f"Rejecting WebSocket connection - user {self.user.id} can't open chat {self.chat_id}")
+            await self.close(code=close_code)
+            return
+
         await self.channel_layer.group_add(self.chat_group_name,
                                            self.channel_name)
 
-        
-        updated_count = await self.mark_messages_as_seen_async()
+        try:
+            with collect_state() as state_frames:
+                cleared, init_frame, replay_frame = await self.load_connect_snapshot(
+                    self.get_last_seq_param())
+        except Chat.DoesNotExist:
+            logger.warning(f"Rejecting WebSocket connection - chat {self.chat_id} does not exist")
+            await self.channel_layer.group_discard(self.chat_group_name,
+                                                   self.channel_name)
+            await self.close(code=4004)
+            return
+        except PermissionDenied:
+            logger.warning(f"Rejecting WebSocket connection - user {self.user.id} left chat {self.chat_id}")
+            await self.channel_layer.group_discard(self.chat_group_name,
+                                                   self.channel_name)
+            await self.close(code=4003)
+            return
 
         
         await self.accept()
         logger.info(f"WebSocket connection ACCEPTED for user {self.user.username} in chat {self.chat_id}")
 
+        # Unread state, Swapanza state and participants in one frame
+        await self.send(text_data=json.dumps(init_frame))
+        if replay_frame is not None:
+            await self.send(text_data=json.dumps(replay_frame))
+        await send_state_async(state_frames)
+
         
-        if updated_count > 0:
-            await self.channel_layer.group_send(self.chat_group_name, {
-                'type': 'messages_read',
+        if cleared > 0:
+            await self.broadcast_frame('messages_read', {
+                'type': 'chat.messages_read',
                 'user_id': self.user.id
             })
 
-        
-        global_state = await self.get_global_swapanza_state()
-        if global_state['active']:
-            partner = global_state['partner']
-            await self.send(text_data=json.dumps({
-                'type':
-                'swapanza.activate',
-                'started_at':
-                global_state['started_at'].isoformat(),
-                'ends_at':
-                global_state['ends_at'].isoformat(),
-                'server_time':
-                timezone.now().isoformat(),
-                'partner_id':
-                partner.id,
-                'partner_username':
-                partner.username,
-                'partner_profile_image':
-                partner.profile_image_url
-                if hasattr(partner, 'profile_image_url') else None,
-                'message_count':
-                global_state['message_count'],
-                'remaining_messages':
-                global_state['remaining_messages']
-            }))
-
-        
-        await self.check_active_swapanza()
-
     async def disconnect(self, close_code):
         logger.info(f"WebSocket DISCONNECT: User {getattr(self.user, 'username', 'anonymous')} (ID: {getattr(self.user, 'id', 'none')}) from chat {self.chat_id} with code {close_code}")
         
@@ -94,7 +157,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
                                                    self.channel_name)
 
         
-        await self.clear_pending_swapanza_request()
+        if await self.clear_pending_swapanza_request():
+            await self.channel_layer.group_send(self.chat_group_name, {
+                'type': 'chat.invalidate'
+            })
 
     
     async def receive(self, text_data):
@@ -111,8 +177,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 if not content:
                     return
 
-                
-                message_data = await self.save_chat_message(content)
+                with collect_state() as state_frames:
+                    message_data = await self.save_chat_message(content)
                 if client_id:
                     message_data['client_id'] = client_id
 
@@ -128,31 +194,28 @@ class ChatConsumer(AsyncWebsocketConsumer):
                         }))
                     return
 
-                
-                # Send notification to all other participants with actual unread count
-                chat = await database_sync_to_async(Chat.objects.get)(id=self.chat_id)
-                participants = await database_sync_to_async(lambda: list(chat.participants.exclude(id=self.user.id)) )()
-                channel_layer = get_channel_layer()
-                for recipient in participants:
-                    # Calculate actual unread count for this recipient
-                    from .models import Message
-                    unread_count = await database_sync_to_async(lambda: Message.objects.filter(chat=chat).exclude(read_by=recipient).exclude(sender=recipient).count())()
-                    await channel_layer.group_send(
-                        f'user_{recipient.id}',
-                        {
-                            'type': 'notify',
-                            'data': {
-                                'type': 'unread_count',
-                                'chat_id': chat.id,
-                                'count': unread_count
-                            }
-                        }
-                    )
-
-                await self.channel_layer.group_send(self.chat_group_name, {
-                    'type': 'chat_message',
-                    'message': message_data
+                await self.broadcast_frame('chat_message', {
+                    'type': 'chat.message',
+                    **message_data
                 })
+                # The other participants' unread counts and the sender's Swapanza quota
+                await send_state_async(state_frames)
+
+            elif message_type == 'chat.replay':
+                # The client saw a gap in seq; send what it is missing
+                try:
+                    after_seq = int(data.get('after_seq'))
+                except (TypeError, ValueError):
+                    await self.send(text_data=json.dumps({
+                        'type': 'error',
+                        'message': 'after_seq must be an integer'
+                    }))
+                    return
+                if await self.check_access() is not None:
+                    await self.close(code=4003)
+                    return
+                await self.send(text_data=json.dumps(
+                    await database_sync_to_async(self.get_replay_frame)(after_seq)))
 
             elif message_type == 'swapanza.request':
                 logger.info(f"Processing Swapanza request from {self.user.username} (ID: {self.user.id})")
@@ -171,8 +234,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 logger.info(f"Swapanza request successful, notifying participants")
                 
                 # Notify all other participants of the Swapanza invite
-                chat = await database_sync_to_async(Chat.objects.get)(id=self.chat_id)
-                participants = await database_sync_to_async(lambda: list(chat.participants.exclude(id=self.user.id)) )()
+                chat = await self.get_chat()
+                participants = self.get_other_participants(chat)
                 channel_layer = get_channel_layer()
                 for recipient in participants:
                     await channel_layer.group_send(
@@ -187,9 +250,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
                         }
                     )
 
-                await self.channel_layer.group_send(
-                    self.chat_group_name, {
-                        'type': 'swapanza_request',
+                await self.broadcast_frame(
+                    'swapanza_request', {
+                        'type': 'swapanza.request',
                         'requested_by': self.user.id,
                         'requested_by_username': self.user.username,
                         'duration': duration
@@ -212,44 +275,28 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     return
 
                 print(f"SENDING GROUP MESSAGE: Broadcasting confirmation to chat group")
-                await self.channel_layer.group_send(
-                    self.chat_group_name, {
-                        'type': 'swapanza_confirm',
+                await self.broadcast_frame(
+                    'swapanza_confirm', {
+                        'type': 'swapanza.confirm',
                         'user_id': self.user.id,
                         'username': self.user.username,
                         'all_confirmed': all_confirmed
                     })
 
-                # If all confirmed, activate Swapanza
+                # If all confirmed, activate Swapanza without holding up this socket
                 if all_confirmed:
                     print(f"ALL CONFIRMED: All users confirmed for chat {self.chat_id}, activating Swapanza after 2 second delay")
                     logger.info(f"All users confirmed for chat {self.chat_id}, activating Swapanza after 2 second delay")
-                    await asyncio.sleep(2)  # Brief delay for UI
-                    success, message, data = await self.activate_swapanza()
-
-                    if success:
-                        logger.info(f"Swapanza activated successfully for chat {self.chat_id}")
-                        await self.channel_layer.group_send(
-                            self.chat_group_name, {
-                                'type': 'swapanza_activate',
-                                'started_at': data['started_at'].isoformat(),
-                                'ends_at': data['ends_at'].isoformat(),
-                                'server_time': timezone.now().isoformat(),
-                                'partner_id': data['partner_id'],
-                                'partner_username': data['partner_username'],
-                                'partner_profile_image': data.get('partner_profile_image')
-                            })
-                    else:
-                        logger.error(f"Failed to activate Swapanza for chat {self.chat_id}: {message}")
-                        await self.send(text_data=json.dumps({
-                            'type': 'error',
-                            'message': message
-                        }))
+                    task = asyncio.ensure_future(self.run_swapanza_activation())
+                    self.background_tasks.add(task)
+                    task.add_done_callback(self.background_tasks.discard)
 
             elif message_type == 'swapanza.cancel':
                 # User requested to cancel their pending Swapanza invite
                 try:
-                    cleared = await self.cancel_swapanza_request()
+                    with collect_state() as state_frames:
+                        cleared = await self.cancel_swapanza_request()
+                    await send_state_async(state_frames)
                     if cleared:
                         # Notify chat group that the swapanza was cancelled
                         await self.channel_layer.group_send(
@@ -262,8 +309,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                         )
 
                         # Also notify other participants via their notification channels to clear any invite markers
-                        chat = await database_sync_to_async(Chat.objects.get)(id=self.chat_id)
-                        participants = await database_sync_to_async(lambda: list(chat.participants.exclude(id=self.user.id)) )()
+                        chat = await self.get_chat()
+                        participants = self.get_other_participants(chat)
                         channel_layer = get_channel_layer()
                         for recipient in participants:
                             await channel_layer.group_send(
@@ -304,51 +351,155 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'message': 'Server error: ' + str(e)
                 }))
 
-    
-    @database_sync_to_async
-    def get_global_swapanza_state(self):
-        """Get the user's global Swapanza state across all chats"""
-        user = self.user
-        now = timezone.now()
-        chat_id = self.chat_id
+    def fetch_chat(self):
+        """Chat row and participants for this connection, cached until invalidated.
+
+        Call from sync (database_sync_to_async) code. The cache is dropped by
+        ``chat.invalidate`` and Swapanza state events on the chat group, so it
+        stays correct across ASGI nodes sharing the channel layer.
+        """
+        if self.cached_chat is None:
+            self.cached_chat = Chat.objects.select_related(
+                'swapanza_requested_by').prefetch_related('participants').get(
+                id=self.chat_id)
+        return self.cached_chat
+
+    async def get_chat(self):
+        """Async access to the cached chat, loading it off the event loop if needed"""
+        if self.cached_chat is None:
+            await database_sync_to_async(self.fetch_chat)()
+        return self.cached_chat
+
+    async def check_access(self):
+        """None if the user may open this chat, else the close code (see chat_access_code)"""
+        return await database_sync_to_async(chat_access_code)(self.chat_id, self.user.id)
+
+    def get_other_participants(self, chat):
+        """Participants of the cached chat other than the current user"""
+        return [p for p in chat.participants.all() if p.id != self.user.id]
+
+    async def chat_invalidate(self, event):
+        """Drop the cached chat after another writer changed it"""
+        self.cached_chat = None
+
+    def get_last_seq_param(self):
+        """``last_seq`` from the handshake query string, or None on a first connect"""
+        from urllib.parse import parse_qs
+        query_string = self.scope.get('query_string', b'').decode()
+        try:
+            return int(parse_qs(query_string)['last_seq'][0])
+        except (KeyError, ValueError):
+            return None
 
-        
-        active_session = SwapanzaSession.objects.filter(
-            user=user, active=True, ends_at__gt=now).first()
+    def get_replay_frame(self, after_seq, last_seq=None):
+        """Messages with ``seq`` above ``after_seq``, oldest first, at most REPLAY_LIMIT.
 
-        if not active_session:
-            return {'active': False}
+        With the chat's ``last_seq`` known, a short gap is served from the
+        message buffer when it holds every missed message.
+        """
+        if last_seq is not None and 0 < last_seq - after_seq <= REPLAY_LIMIT:
+            buffered = get_recent_messages(self.chat_id, last_seq, last_seq - after_seq)
+            if buffered is not None:
+                return {
+                    'type': 'chat.replay',
+                    'after_seq': after_seq,
+                    'messages': buffered[::-1],
+                    'truncated': False
+                }
 
-        
-        
-        if active_session.chat:
-            chat = active_session.chat
-            
-            if int(self.chat_id) != chat.id:
-                
-                current_chat = Chat.objects.get(id=self.chat_id)
-                chat_message_counts = current_chat.swapanza_message_count or {}
-                message_count = chat_message_counts.get(str(user.id), 0)
-            else:
-                
-                chat_message_counts = chat.swapanza_message_count or {}
-                message_count = chat_message_counts.get(str(user.id), 0)
+        messages = list(
+            Message.objects.filter(chat_id=self.chat_id,
+                                   seq__gt=after_seq).order_by('seq')[:REPLAY_LIMIT + 1])
+        return {
+            'type': 'chat.replay',
+            'after_seq': after_seq,
+            'messages': MessageSerializer(messages[:REPLAY_LIMIT], many=True).data,
+            'truncated': len(messages) > REPLAY_LIMIT
+        }
+
+    @database_sync_to_async
+    def load_connect_snapshot(self, last_seq=None):
+        """Mark the chat read and build the ``init`` frame in a single thread hop.
+
+        Costs a fixed handful of queries: the chat and its participants (kept
+        as the connection's cache), the read watermark update and the user's
+        active session, plus the missed messages on a reconnect with
+        ``last_seq``. Returns ``(cleared_unread_count, init_frame,
+        replay_frame_or_None)``. Raises Chat.DoesNotExist for an unknown chat
+        and PermissionDenied if the user is no longer a participant.
+        """
+        chat = self.fetch_chat()
+        if not any(p.id == self.user.id for p in chat.participants.all()):
+            raise PermissionDenied
+        try:
+            cleared = ChatMembership.mark_read(self.user.id, self.chat_id)
+        except Exception as e:
+            logger.error(f"Error marking messages as read: {str(e)}")
+            cleared = 0
+        if cleared:
+            publish_unread_cleared(self.user.id, self.chat_id)
+        now = timezone.now()
+        participants = list(chat.participants.all())
+
+        replay_frame = None
+        if last_seq is not None and last_seq < chat.last_seq:
+            replay_frame = self.get_replay_frame(last_seq, chat.last_seq)
+
+        return cleared, {
+            'type': 'init',
+            'chat_id': chat.id,
+            'last_seq': chat.last_seq,
+            'server_time': now.isoformat(),
+            'participants': UserSummarySerializer(participants, many=True).data,
+            'unread_cleared': cleared,
+            'swapanza': self.get_swapanza_snapshot(chat, participants, now),
+            'swapanza_request': self.get_swapanza_request_snapshot(chat),
+        }, replay_frame
+
+    def get_swapanza_snapshot(self, chat, participants, now):
+        """The user's running Swapanza as seen from this chat, or None"""
+        session = SwapanzaSession.objects.filter(
+            user=self.user, active=True,
+            ends_at__gt=now).select_related('partner').first()
+
+        if session:
+            # The session may belong to another chat; quotas are per chat
+            partner = session.partner
+            started_at, ends_at = session.started_at, session.ends_at
+            message_count = get_swapanza_store().get_chat_count(
+                session.id, chat.id, session.ends_at,
+                seed=lambda: self.count_swapanza_messages(session)[0])
+        elif chat.swapanza_active and chat.swapanza_ends_at and chat.swapanza_ends_at > now:
+            partner = next((p for p in participants if p.id != self.user.id), None)
+            if partner is None:
+                return None
+            started_at, ends_at = chat.swapanza_started_at, chat.swapanza_ends_at
+            message_count = SwapanzaParticipant.objects.filter(
+                chat_id=chat.id, user=self.user).values_list(
+                    'message_count', flat=True).first() or 0
         else:
-            
-            message_count = Message.objects.filter(
-                sender=user,
-                chat_id=chat_id,
-                during_swapanza=True,
-                created_at__gte=active_session.started_at).count()
+            return None
 
         return {
-            'active': True,
-            'partner': active_session.partner,
-            'started_at': active_session.started_at,
-            'ends_at': active_session.ends_at,
+            'started_at': started_at.isoformat(),
+            'ends_at': ends_at.isoformat(),
+            'partner_id': partner.id,
+            'partner_username': partner.username,
+            'partner_profile_image': partner.profile_image_url,
             'message_count': message_count,
-            'remaining_messages': max(0, 2 - message_count),
-            'chat_id': active_session.chat.id if active_session.chat else None
+            'remaining_messages': max(0, SWAPANZA_MESSAGE_LIMIT - message_count)
+        }
+
+    def get_swapanza_request_snapshot(self, chat):
+        """The chat's pending Swapanza invite, or None"""
+        if not chat.swapanza_requested_by_id or chat.swapanza_active:
+            return None
+        return {
+            'requested_by': chat.swapanza_requested_by_id,
+            'requested_by_username': chat.swapanza_requested_by.username,
+            'duration': chat.swapanza_duration,
+            'requested_at': chat.swapanza_requested_at.isoformat() if chat.swapanza_requested_at else None,
+            'confirmed_users': chat.swapanza_confirmed_users
         }
 
     
@@ -356,12 +507,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
     def save_chat_message(self, content):
         """Save a chat message to the database with Swapanza validation"""
         user = self.user
-        chat = Chat.objects.get(id=self.chat_id)
+        chat = self.fetch_chat()
         now = timezone.now()
 
         
         active_session = SwapanzaSession.objects.filter(
-            user=user, active=True, ends_at__gt=now).first()
+            user=user, active=True,
+            ends_at__gt=now).select_related('partner').first()
 
         
         during_swapanza = active_session is not None
@@ -373,23 +525,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         if during_swapanza:
             
-            
-            chat_messages_sent = Message.objects.filter(
-                sender=user,
-                chat=chat,  
-                during_swapanza=True,
-                created_at__gte=active_session.started_at).count()
-
-            
-            if chat_messages_sent >= 2:
-                return {
-                    'error': True,
-                    'message':
-                    "You have reached your message limit for this chat during Swapanza",
-                    'content': content
-                }
-
-            
             if len(content) > 7:
                 return {
                     'error': True,
@@ -425,36 +560,50 @@ class ChatConsumer(AsyncWebsocketConsumer):
             else:
                 apparent_sender_profile_image = ""  
 
-        
-        message = Message.objects.create(
-            sender=user,
-            chat=chat,
-            content=content,
-            during_swapanza=during_swapanza,
-            apparent_sender=apparent_sender,
-            apparent_sender_username=apparent_sender_username,
-            apparent_sender_profile_image=apparent_sender_profile_image)
+            # Atomic quota check; counters expire with the session
+            store = get_swapanza_store()
+            actual_message_count = store.reserve_message(
+                active_session.id, chat.id, SWAPANZA_MESSAGE_LIMIT,
+                active_session.ends_at,
+                seed=lambda: self.count_swapanza_messages(active_session))
+
+            if actual_message_count is None:
+                return {
+                    'error': True,
+                    'message':
+                    "You have reached your message limit for this chat during Swapanza",
+                    'content': content
+                }
+
+        try:
+            message = Message.objects.create(
+                sender=user,
+                chat=chat,
+                content=content,
+                during_swapanza=during_swapanza,
+                apparent_sender=apparent_sender,
+                apparent_sender_username=apparent_sender_username,
+                apparent_sender_profile_image=apparent_sender_profile_image)
+        except Exception:
+            if during_swapanza:
+                store.release_message(active_session.id, chat.id)
+            raise
+        buffer_message(message)
+        publish_unread_counts(chat.id, exclude_user_id=user.id)
 
         
         if during_swapanza:
             
-            actual_message_count = chat_messages_sent + 1  
-            remaining_messages = max(0, 2 - actual_message_count)
-
-            
-            
-            chat.refresh_from_db(fields=['swapanza_message_count'])
-            chat_message_counts = chat.swapanza_message_count or {}
-            user_id_str = str(user.id)
+            remaining_messages = max(0, SWAPANZA_MESSAGE_LIMIT - actual_message_count)
 
-            
-            chat_message_counts[user_id_str] = actual_message_count
-            chat.swapanza_message_count = chat_message_counts
-            chat.save(update_fields=['swapanza_message_count'])
+            if active_session.chat_id == chat.id:
+                SwapanzaParticipant.record_message(chat.id, user.id)
+            publish_swapanza_state([user.id])
 
         
         result = {
             'id': message.id,
+            'seq': message.seq,
             'sender': user.id,
             'content': content,
             'created_at': message.created_at.isoformat(),
@@ -467,129 +616,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         return result
 
-    
-    @database_sync_to_async
-    def check_active_swapanza(self):
-        """Check if the current chat has an active Swapanza and notify client"""
-        chat = Chat.objects.get(id=self.chat_id)
-        now = timezone.now()
-        user = self.user
-
-        
-        if chat.swapanza_active and chat.swapanza_ends_at and chat.swapanza_ends_at > now:
-            
-            participants = list(chat.participants.all())
-            if len(participants) < 2:
-                return
-
-            other_participant = None
-            for p in participants:
-                if p.id != self.user.id:
-                    other_participant = p
-                    break
-
-            if not other_participant:
-                return
-
-            
-            chat_message_counts = chat.swapanza_message_count or {}
-            user_id_str = str(self.user.id)
-
-            
-            if user_id_str not in chat_message_counts:
-                chat_message_counts[user_id_str] = 0
-                chat.swapanza_message_count = chat_message_counts
-                chat.save(update_fields=['swapanza_message_count'])
-                current_count = 0
-            else:
-                current_count = chat_message_counts.get(user_id_str, 0)
-
-            
-            remaining_messages = max(0, 2 - current_count)
-
-            
-            logger.info(
-                f"Active Swapanza in chat {chat.id} - user {user_id_str} has {current_count} messages, {remaining_messages} remaining"
-            )
-
-            
-            return self.send(text_data=json.dumps({
-                'type':
-                'swapanza.activate',
-                'started_at':
-                chat.swapanza_started_at.isoformat(),
-                'ends_at':
-                chat.swapanza_ends_at.isoformat(),
-                'server_time':
-                now.isoformat(),
-                'partner_id':
-                other_participant.id,
-                'partner_username':
-                other_participant.username,
-                'partner_profile_image':
-                other_participant.profile_image_url if hasattr(
-                    other_participant, 'profile_image_url') else None,
-                'remaining_messages':
-                remaining_messages
-            }))
-        else:
-            
-            active_session = SwapanzaSession.objects.filter(
-                user=self.user, active=True, ends_at__gt=now).first()
-
-            if active_session and active_session.chat_id != int(self.chat_id):
-                
-                
-                actual_message_count = Message.objects.filter(
-                    sender=user,
-                    chat_id=self.chat_id,  
-                    during_swapanza=True,
-                    created_at__gte=active_session.started_at).count()
-
-                
-                chat_message_counts = chat.swapanza_message_count or {}
-                user_id_str = str(self.user.id)
-
-                
-                
-                if actual_message_count == 0:
-                    
-                    remaining_messages = 2
-                else:
-                    
-                    remaining_messages = max(0, 2 - actual_message_count)
-
-                
-                if user_id_str not in chat_message_counts or chat_message_counts[
-                        user_id_str] != actual_message_count:
-                    chat_message_counts[user_id_str] = actual_message_count
-                    chat.swapanza_message_count = chat_message_counts
-                    chat.save(update_fields=['swapanza_message_count'])
-
-                logger.info(
-                    f"Global Swapanza active - user {user.id} has {actual_message_count} messages in chat {self.chat_id}, SHOWING {remaining_messages} remaining"
-                )
-
-                
-                return self.send(text_data=json.dumps({
-                    'type':
-                    'swapanza.activate',
-                    'started_at':
-                    active_session.started_at.isoformat(),
-                    'ends_at':
-                    active_session.ends_at.isoformat(),
-                    'server_time':
-                    now.isoformat(),
-                    'partner_id':
-                    active_session.partner.id,
-                    'partner_username':
-                    active_session.partner.username,
-                    'partner_profile_image':
-                    active_session.partner.profile_image_url if hasattr(
-                        active_session.partner, 'profile_image_url') else None,
-                    'remaining_messages':
-                    remaining_messages  
-                }))
+    def count_swapanza_messages(self, session):
+        """Durable (this chat, all chats) message counts for a session, used to seed the store"""
+        sent = Message.objects.filter(sender=self.user,
+                                      during_swapanza=True,
+                                      created_at__gte=session.started_at)
+        return sent.filter(chat_id=self.chat_id).count(), sent.count()
 
     
     @database_sync_to_async
@@ -613,7 +645,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
                         logger.info(
                             f"Clearing stale Swapanza request from {chat.swapanza_requested_by.username}")
                         chat.swapanza_requested_by = None
-                        chat.swapanza_confirmed_users = []
                         
                     else:
                         
@@ -627,10 +658,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     
                     
                     chat.swapanza_requested_by = None
-                    chat.swapanza_confirmed_users = []
 
             
-            participants = list(chat.participants.all())
+            participants = list(self.fetch_chat().participants.all())
             active_sessions = SwapanzaSession.objects.filter(
                 user__in=participants, active=True, ends_at__gt=timezone.now())
 
@@ -646,18 +676,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
             print(f"SETTING SWAPANZA REQUEST: User {self.user.username} requesting in chat {self.chat_id}")
             chat.swapanza_requested_by = self.user  
             chat.swapanza_duration = duration
-            # Initialize confirmed_users with the requester's ID (they're auto-confirmed)
-            chat.swapanza_confirmed_users = [str(self.user.id)]  
-            print(f"PRE-SAVE DEBUG: Setting confirmed_users to [{str(self.user.id)}] for user {self.user.username} (ID: {self.user.id})")
             chat.swapanza_requested_at = timezone.now()  
-            chat.save(update_fields=[
-                'swapanza_requested_by', 'swapanza_duration',
-                'swapanza_confirmed_users', 'swapanza_requested_at'
-            ])
-            # Verify the save actually worked
-            chat.refresh_from_db()
-            print(f"POST-SAVE CHECK: Database now shows confirmed_users={chat.swapanza_confirmed_users}")
-            print(f"SWAPANZA REQUEST SAVED: Chat {self.chat_id} now has request by {chat.swapanza_requested_by.username} at {chat.swapanza_requested_at} with confirmed_users={chat.swapanza_confirmed_users}")
+            with transaction.atomic():
+                chat.save(update_fields=[
+                    'swapanza_requested_by', 'swapanza_duration',
+                    'swapanza_requested_at'
+                ])
+                # Fresh participant rows; the requester is auto-confirmed
+                SwapanzaParticipant.start_invite(
+                    chat.id, [p.id for p in participants], self.user.id)
+                schedule_stale_invite_cleanup(chat.id, chat.swapanza_requested_at)
+            print(f"SWAPANZA REQUEST SAVED: Chat {self.chat_id} now has request by {self.user.username} at {chat.swapanza_requested_at}")
 
             return True, None
         except Exception as e:
@@ -674,7 +703,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
             
             # Debug logging
             print(f"CONFIRM SWAPANZA CALLED: User {self.user.username} (ID: {self.user.id}) attempting to confirm in chat {self.chat_id}")
-            print(f"CHAT STATE: requested_by={chat.swapanza_requested_by}, requested_at={chat.swapanza_requested_at}, confirmed_users={chat.swapanza_confirmed_users}")
+            print(f"CHAT STATE: requested_by={chat.swapanza_requested_by}, requested_at={chat.swapanza_requested_at}")
             logger.info(f"User {self.user.username} (ID: {self.user.id}) attempting to confirm Swapanza in chat {self.chat_id}")
 
             # Check if there's an active invitation to confirm
@@ -685,40 +714,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
             logger.info(f"Active Swapanza request by {chat.swapanza_requested_by.username} found")
 
-            print(f"BEFORE CONFIRMED USERS: About to get confirmed users list")
-            # Get current confirmed users
-            try:
-                confirmed_users = chat.swapanza_confirmed_users or []
-                print(f"CONFIRMED USERS: Current confirmed users: {confirmed_users}")
-            except Exception as e:
-                print(f"ERROR GETTING CONFIRMED USERS: {str(e)}")
-                logger.error(f"Error getting confirmed users: {str(e)}")
-                return False, f"Error getting confirmed users: {str(e)}", False
-            logger.info(f"Current confirmed users: {confirmed_users}")
-
-            # Check if already confirmed
-            if str(self.user.id) in confirmed_users:
+            # Single conditional UPDATE on the user's row; concurrent confirmations can't clobber each other
+            if not SwapanzaParticipant.confirm(chat.id, self.user.id):
                 print(f"ALREADY CONFIRMED: User {self.user.username} already confirmed")
                 logger.info(f"User {self.user.username} already confirmed")
                 return True, "Already confirmed", False
 
-            # Add user to confirmed list
-            confirmed_users.append(str(self.user.id))
-            chat.swapanza_confirmed_users = confirmed_users
-            chat.save(update_fields=['swapanza_confirmed_users'])
-            
-            print(f"SAVED CONFIRMATION: Updated confirmed users: {confirmed_users}")
-            logger.info(f"Updated confirmed users: {confirmed_users}")
-
-            # Check if all participants confirmed
-            participants = list(chat.participants.all())
-            participant_ids = [str(p.id) for p in participants]
-            all_confirmed = len(confirmed_users) == len(participants)
-            
-            print(f"PARTICIPANTS: {[p.username for p in participants]} (IDs: {participant_ids})")
-            print(f"ALL CONFIRMED CHECK: {all_confirmed} ({len(confirmed_users)}/{len(participants)})")
-            logger.info(f"Participants: {[p.username for p in participants]} (IDs: {participant_ids})")
-            logger.info(f"All confirmed: {all_confirmed} ({len(confirmed_users)}/{len(participants)})")
+            all_confirmed = SwapanzaParticipant.all_confirmed(chat.id)
+            print(f"ALL CONFIRMED CHECK: {all_confirmed}")
+            logger.info(f"User {self.user.username} confirmed; all confirmed: {all_confirmed}")
 
             return True, "Confirmation successful", all_confirmed
         except Exception as e:
@@ -729,7 +733,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
     
     @database_sync_to_async
     def activate_swapanza(self):
-        """Activate Swapanza after all participants have confirmed"""
+        """Activate Swapanza after all participants have confirmed.
+
+        Several sockets can get here for the same invite; the conditional
+        update lets exactly one of them activate it. The others get
+        ``(False, None, None)`` and stay silent.
+        """
         try:
             with transaction.atomic():
                 chat = Chat.objects.get(id=self.chat_id)
@@ -737,71 +746,66 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 logger.info(f"Attempting to activate Swapanza for chat {self.chat_id}")
 
                 # Verify request exists
-                if not chat.swapanza_requested_by:
+                if not chat.swapanza_requested_by_id:
+                    if chat.swapanza_active:
+                        return False, None, None
                     logger.error(f"No Swapanza request exists for chat {self.chat_id}")
                     return False, "No Swapanza request exists", None
 
                 # Check all participants confirmed
-                participants = list(chat.participants.all())
-                confirmed_users = chat.swapanza_confirmed_users or []
+                participants = list(self.fetch_chat().participants.all())
                 
                 logger.info(f"Participants: {[p.username for p in participants]} (count: {len(participants)})")
-                logger.info(f"Confirmed users: {confirmed_users} (count: {len(confirmed_users)})")
                 
-                if len(confirmed_users) != len(participants):
-                    logger.error(f"Not all participants confirmed: {len(confirmed_users)}/{len(participants)}")
+                if not SwapanzaParticipant.all_confirmed(chat.id):
+                    logger.error(f"Not all participants confirmed in chat {self.chat_id}")
                     return False, "Not all participants have confirmed", None
 
                 # Create timing
                 duration = chat.swapanza_duration or 5
                 start_time = timezone.now()
                 end_time = start_time + timezone.timedelta(minutes=duration)
-                
-                logger.info(f"Creating Swapanza session: {duration} minutes from {start_time} to {end_time}")
 
-                # Activate chat Swapanza state
-                chat.swapanza_active = True
-                chat.swapanza_started_at = start_time
-                chat.swapanza_ends_at = end_time
-                chat.swapanza_message_count = {}
-                chat.save(update_fields=[
-                    'swapanza_active', 'swapanza_started_at',
-                    'swapanza_ends_at', 'swapanza_message_count'
-                ])
+                # Claim this invite; a concurrent activation finds nothing to update
+                claimed = Chat.objects.filter(
+                    id=chat.id,
+                    swapanza_active=False,
+                    swapanza_requested_by_id=chat.swapanza_requested_by_id,
+                    swapanza_requested_at=chat.swapanza_requested_at).update(
+                        swapanza_active=True,
+                        swapanza_started_at=start_time,
+                        swapanza_ends_at=end_time)
+                if not claimed:
+                    logger.info(f"Swapanza for chat {self.chat_id} was already activated")
+                    return False, None, None
+                SwapanzaParticipant.reset_message_counts(chat.id)
+
+                logger.info(f"Creating Swapanza session: {duration} minutes from {start_time} to {end_time}")
+                schedule_swapanza_expiry(chat.id, end_time)
 
                 # Deactivate any existing sessions
                 SwapanzaSession.objects.filter(
                     user__in=participants, active=True).update(active=False)
 
                 # Create Swapanza sessions for each user-partner pair
-                created_sessions = []
-                for i, user1 in enumerate(participants):
-                    for j, user2 in enumerate(participants):
-                        if i != j:  # Don't pair user with themselves
-                            logger.info(f"Creating session: {user1.username} as {user2.username}")
-                            session = SwapanzaSession.objects.create(
-                                user=user1,
-                                partner=user2,
-                                chat=chat,
-                                started_at=start_time,
-                                ends_at=end_time,
-                                active=True,
-                                message_count=0
-                            )
-                            created_sessions.append(session)
-
-                logger.info(f"Created {len(created_sessions)} Swapanza sessions")
-
-                # Find current user's session for return data
-                current_user_session = next(
-                    (s for s in created_sessions if s.user.id == self.user.id),
-                    None)
+                SwapanzaSession.objects.bulk_create([
+                    SwapanzaSession(user=user1,
+                                    partner=user2,
+                                    chat=chat,
+                                    started_at=start_time,
+                                    ends_at=end_time,
+                                    active=True,
+                                    message_count=0)
+                    for user1 in participants for user2 in participants
+                    if user1.id != user2.id
+                ])
+                publish_swapanza_state(p.id for p in participants)
 
-                if not current_user_session:
-                    logger.error(f"Could not find session for current user {self.user.username}")
-                    return False, "Could not create Swapanza session for current user", None
+                # Current user appears as the first other participant
+                partner = next((p for p in participants if p.id != self.user.id), None)
+                if partner is None:
+                    raise ValueError(f"Could not create Swapanza session for current user {self.user.username}")
 
-                partner = current_user_session.partner
                 logger.info(f"Current user {self.user.username} will appear as {partner.username}")
 
                 return True, "Swapanza activated successfully", {
@@ -810,119 +814,92 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'partner_id': partner.id,
                     'partner_username': partner.username,
                     'partner_profile_image': partner.profile_image_url if hasattr(partner, 'profile_image_url') else None,
-                    'remaining_messages': 2
+                    'remaining_messages': SWAPANZA_MESSAGE_LIMIT
                 }
         except Exception as e:
             logger.error(f"Error activating Swapanza: {str(e)}")
             logger.error(traceback.format_exc())
             return False, str(e), None
 
-    async def chat_message(self, event):
-        """Send chat message to WebSocket"""
-        message = event['message']
-
-        
-        data_to_send = {
-            'type': 'chat.message',
-        }
-
-        
-        for key, value in message.items():
-            data_to_send[key] = value
-
-        
-        if message.get('during_swapanza') and message.get('apparent_sender'):
-            
-            try:
-                apparent_sender_id = message.get('apparent_sender')
-
-                
-                apparent_sender = await sync_to_async(User.objects.get)(id=apparent_sender_id)
-                data_to_send[
-                    'apparent_sender_username'] = apparent_sender.username
-
-                
-                if hasattr(apparent_sender, 'profile_image_url'
-                           ) and apparent_sender.profile_image_url:
-                    data_to_send[
-                        'apparent_sender_profile_image'] = apparent_sender.profile_image_url
-                elif hasattr(apparent_sender, 'profile') and hasattr(
-                        apparent_sender.profile, 'profile_image_url'
-                ) and apparent_sender.profile.profile_image_url:
-                    data_to_send[
-                        'apparent_sender_profile_image'] = apparent_sender.profile.profile_image_url
-                else:
-                    data_to_send[
-                        'apparent_sender_profile_image'] = ""  
-            except Exception as e:
-                logger.error(f"Error getting apparent sender info: {str(e)}")
-
-        await self.send(text_data=json.dumps(data_to_send))
-
-    async def messages_read(self, event):
-        """Notify WebSocket that messages have been read"""
-        await self.send(text_data=json.dumps({
-            'type': 'chat.messages_read',
-            'user_id': event['user_id']
-        }))
-
-    async def swapanza_request(self, event):
-        """Send Swapanza request to WebSocket"""
-        await self.send(text_data=json.dumps(
-            {
-                'type': 'swapanza.request',
-                'requested_by': event['requested_by'],
-                'requested_by_username': event['requested_by_username'],
-                'duration': event['duration']
-            }))
-
-    async def swapanza_confirm(self, event):
-        """Send Swapanza confirmation to WebSocket"""
-        await self.send(
-            text_data=json.dumps({
-                'type': 'swapanza.confirm',
-                'user_id': event['user_id'],
-                'username': event['username'],
-                'all_confirmed': event['all_confirmed']
-            }))
-
-    async def swapanza_activate(self, event):
-        """Send Swapanza activation to WebSocket"""
-        
-        await self.send(text_data=json.dumps(
-            {
-                'type': 'swapanza.activate',
-                'started_at': event['started_at'],
-                'ends_at': event['ends_at'],
-                'server_time': event.get('server_time', timezone.now().isoformat()),
-                'partner_id': event['partner_id'],
-                'partner_username': event['partner_username'],
-                'partner_profile_image': event.get('partner_profile_image'),
-                'remaining_messages':
-                2  
-            }))
-
+    async def run_swapanza_activation(self):
+        """Activate the confirmed Swapanza after a brief delay for the UI and announce it"""
+        try:
+            await asyncio.sleep(2)  # Brief delay for UI
+            with collect_state() as state_frames:
+                success, message, data = await self.activate_swapanza()
+            await send_state_async(state_frames)
+
+            if success:
+                logger.info(f"Swapanza activated successfully for chat {self.chat_id}")
+                await self.broadcast_frame(
+                    'swapanza_activate', {
+                        'type': 'swapanza.activate',
+                        'started_at': data['started_at'].isoformat(),
+                        'ends_at': data['ends_at'].isoformat(),
+                        'server_time': timezone.now().isoformat(),
+                        'partner_id': data['partner_id'],
+                        'partner_username': data['partner_username'],
+                        'partner_profile_image': data.get('partner_profile_image'),
+                        'remaining_messages': SWAPANZA_MESSAGE_LIMIT
+                    })
+            elif message:
+                logger.error(f"Failed to activate Swapanza for chat {self.chat_id}: {message}")
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': message
+                }))
+        except Exception as e:
+            logger.error(f"Error running Swapanza activation: {e}\n{traceback.format_exc()}")
+
+    async def broadcast_frame(self, event_type, frame):
+        """Encode a client frame once and fan it out to every socket in the chat group.
+
+        The event carries the frame as JSON text and as msgpack bytes, so no
+        socket re-encodes it.
+        """
+        await self.channel_layer.group_send(self.chat_group_name, {
+            'type': event_type,
+            'text': json.dumps(frame),
+            'bytes': encode_msgpack(frame)
+        })
+
+    async def forward_frame(self, event):
+        """Send a frame that was already encoded by broadcast_frame"""
+        text_data, bytes_data = self.frame_data(event)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    async def forward_state_frame(self, event):
+        """Forward a Swapanza state change, dropping the now stale chat cache first"""
+        self.cached_chat = None
+        text_data, bytes_data = self.frame_data(event)
+        await self.send(text_data=text_data, bytes_data=bytes_data)
+
+    # Group events produced by broadcast_frame are forwarded unchanged
+    chat_message = forward_frame
+    messages_read = forward_frame
+    swapanza_request = forward_state_frame
+    swapanza_confirm = forward_state_frame
+    swapanza_activate = forward_state_frame
+
+    # Expire and cancel are emitted after the emitter has already reset the
+    # chat and its sessions, so consumers only forward them.
     async def swapanza_expire(self, event):
         """Notify WebSocket that Swapanza has expired"""
+        self.cached_chat = None
         await self.send(text_data=json.dumps({
             'type': 'swapanza.expire',
             'force_redirect': True
         }))
 
-        
-        await self.deactivate_swapanza_sessions()
-
     async def swapanza_cancel(self, event):
         """Notify clients that a Swapanza invite was cancelled by the requester"""
+        self.cached_chat = None
         try:
             await self.send(text_data=json.dumps({
                 'type': 'swapanza.cancel',
                 'cancelled_by': event.get('cancelled_by'),
                 'cancelled_by_username': event.get('cancelled_by_username')
             }))
-
-            # Ensure any active sessions are deactivated and pending invites cleared where appropriate
-            await self.deactivate_swapanza_sessions()
         except Exception as e:
             logger.error(f"Error sending swapanza_cancel to client: {e}")
 
@@ -945,70 +922,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
         # Close the WebSocket connection
         await self.close(code=4000)
 
-    @database_sync_to_async
-    def deactivate_swapanza_sessions(self):
-        """Deactivate all Swapanza sessions for this chat and clear pending invites"""
-        try:
-            chat = Chat.objects.get(id=self.chat_id)
-
-            # Always deactivate all sessions for all participants
-            participants = list(chat.participants.all())
-            SwapanzaSession.objects.filter(user__in=participants,
-                                         chat=chat,
-                                         active=True).update(active=False)
-
-            # Always reset ALL Swapanza state
-            chat.swapanza_active = False
-            chat.swapanza_requested_by = None
-            chat.swapanza_requested_at = None
-            chat.swapanza_confirmed_users = []
-            chat.swapanza_duration = None
-            chat.swapanza_started_at = None
-            chat.swapanza_ends_at = None
-            chat.swapanza_message_count = {}
-            
-            update_fields = [
-                'swapanza_active',
-                'swapanza_requested_by',
-                'swapanza_requested_at',
-                'swapanza_confirmed_users',
-                'swapanza_duration',
-                'swapanza_started_at',
-                'swapanza_ends_at',
-                'swapanza_message_count'
-            ]
-            chat.save(update_fields=update_fields)
-
-            logger.info(f"Deactivated Swapanza sessions for chat {self.chat_id} (cleared pending invite if stale and not all confirmed)")
-            return True
-        except Exception as e:
-            logger.error(f"Error deactivating Swapanza sessions: {str(e)}")
-            return False
-
-    @database_sync_to_async
-    def mark_messages_as_seen_async(self):
-        """Mark all messages in the chat as seen by the current user"""
-        try:
-            chat = Chat.objects.get(id=self.chat_id)
-
-            
-            unread_messages = Message.objects.filter(chat=chat).exclude(
-                read_by=self.user).exclude(sender=self.user)
-
-            
-            updated_count = 0
-            for message in unread_messages:
-                message.read_by.add(self.user)
-                updated_count += 1
-
-            logger.info(
-                f"Marked {updated_count} messages as read in chat {self.chat_id}"
-            )
-            return updated_count
-        except Exception as e:
-            logger.error(f"Error marking messages as read: {str(e)}")
-            return 0
-
     @database_sync_to_async
     def get_active_swapanza_session(self):
         """Get the user's active Swapanza session in this chat if any"""
@@ -1022,90 +935,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error getting active Swapanza session: {str(e)}")
             return None
 
-    @database_sync_to_async
-    def update_chat_with_swapanza_request(self, duration):
-        """Update chat with Swapanza request info"""
-        chat = Chat.objects.get(id=self.chat_id)
-
-        
-        if not chat.swapanza_active:
-            chat.swapanza_requested_by = self.user
-            chat.swapanza_duration = duration
-            chat.swapanza_confirmed_users = []
-            chat.save(update_fields=[
-                'swapanza_requested_by', 'swapanza_duration',
-                'swapanza_confirmed_users'
-            ])
-
-        return chat
-
-    @database_sync_to_async
-    def create_swapanza_sessions(self, start_time, end_time):
-        """Create Swapanza sessions in a transaction"""
-        try:
-            with transaction.atomic():
-                chat = Chat.objects.get(id=self.chat_id)
-
-                
-                if chat.swapanza_active and chat.swapanza_ends_at and chat.swapanza_ends_at > timezone.now(
-                ):
-                    return False, "A Swapanza is already active in this chat"
-
-                participants = list(chat.participants.all())
-
-                if len(participants) < 2:
-                    raise ValueError(
-                        "Need at least 2 participants for Swapanza")
-
-                
-                active_sessions = SwapanzaSession.objects.filter(
-                    user__in=participants,
-                    active=True,
-                    ends_at__gt=timezone.now()).exclude(chat=chat)
-
-                if active_sessions.exists():
-                    
-                    active_users = active_sessions.values_list(
-                        'user__username', flat=True)
-                    return False, f"Cannot start Swapanza: {', '.join(active_users)} already have active Swapanza sessions"
-
-                
-                SwapanzaSession.objects.filter(
-                    chat=chat, active=True).update(active=False)
-
-                
-                user1, user2 = participants[:2]
-                SwapanzaSession.objects.create(user=user1,
-                                               partner=user2,
-                                               started_at=start_time,
-                                               ends_at=end_time,
-                                               active=True,
-                                               message_count=0,
-                                               chat=chat)
-                SwapanzaSession.objects.create(user=user2,
-                                               partner=user1,
-                                               started_at=start_time,
-                                               ends_at=end_time,
-                                               active=True,
-                                               message_count=0,
-                                               chat=chat)
-
-                
-                chat.swapanza_active = True
-                chat.swapanza_started_at = start_time
-                chat.swapanza_ends_at = end_time
-                chat.swapanza_message_count = {}
-                chat.save(update_fields=[
-                    'swapanza_active', 'swapanza_started_at',
-                    'swapanza_ends_at', 'swapanza_message_count'
-                ])
-
-            return True, None
-        except Exception as e:
-            logger.error(f"Error creating Swapanza sessions: {str(e)}")
-            logger.error(traceback.format_exc())  
-            return False, str(e)
-
     @database_sync_to_async
     def can_start_swapanza(self):
         """Check if user can start or join a Swapanza"""
@@ -1138,21 +967,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def add_swapanza_confirmation(self):
         """Add user to confirmed list and check if all confirmed"""
-        chat = Chat.objects.get(id=self.chat_id)
-        confirmed_users = chat.swapanza_confirmed_users or []
+        SwapanzaParticipant.confirm(self.chat_id, self.user.id)
 
-        user_id_str = str(self.user.id)
-        if user_id_str not in confirmed_users:
-            confirmed_users.append(user_id_str)
-            chat.swapanza_confirmed_users = confirmed_users
-            chat.save(update_fields=['swapanza_confirmed_users'])
+        confirmed_users = [
+            str(user_id) for user_id in SwapanzaParticipant.objects.filter(
+                chat_id=self.chat_id, confirmed_at__isnull=False).values_list(
+                    'user_id', flat=True)
+        ]
+        participant_count = Chat.participants.through.objects.filter(
+            chat_id=self.chat_id).count()
 
-        
-        participants = list(chat.participants.values_list('id', flat=True))
-        all_confirmed = all(
-            str(uid) in confirmed_users for uid in participants)
-
-        return all_confirmed, confirmed_users, len(participants)
+        return len(confirmed_users) == participant_count, confirmed_users, participant_count
 
     @database_sync_to_async
     def cancel_swapanza_request(self):
@@ -1171,10 +996,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 chat.swapanza_requested_by = None
                 instance_updated = True
                 
-            if chat.swapanza_confirmed_users:
-                chat.swapanza_confirmed_users = []
-                instance_updated = True
-                
             if chat.swapanza_requested_at:
                 chat.swapanza_requested_at = None
                 instance_updated = True
@@ -1188,7 +1009,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 chat.swapanza_active = False
                 chat.swapanza_started_at = None
                 chat.swapanza_ends_at = None
-                chat.swapanza_message_count = {}
                 instance_updated = True
                 
                 # Deactivate any active sessions
@@ -1196,13 +1016,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     chat=chat, 
                     active=True
                 ).update(active=False)
+                publish_swapanza_state(participants)
             
             if instance_updated:
                 chat.save(update_fields=[
-                    'swapanza_requested_by', 'swapanza_confirmed_users', 
+                    'swapanza_requested_by',
                     'swapanza_requested_at', 'swapanza_duration',
                     'swapanza_active', 'swapanza_started_at', 
-                    'swapanza_ends_at', 'swapanza_message_count'
+                    'swapanza_ends_at'
                 ])
                 logger.info(f"Cleared all Swapanza state for chat {self.chat_id} by user {self.user.username}")
                 return True
@@ -1216,6 +1037,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
     def clear_pending_swapanza_request(self):
         """Clear any pending Swapanza request for this chat when a user disconnects (only for requests they made)"""
         try:
+            if (self.cached_chat is not None
+                    and self.cached_chat.swapanza_requested_by_id != self.user.id):
+                return False
+
             chat = Chat.objects.get(id=self.chat_id)
 
             # Only clear if current user was the requester (to avoid clearing others' requests on disconnect)
@@ -1225,11 +1050,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 
                 logger.info(f"Clearing pending Swapanza request from {self.user.username} in chat {self.chat_id}")
                 chat.swapanza_requested_by = None
-                chat.swapanza_confirmed_users = []
                 chat.swapanza_requested_at = None
                 chat.swapanza_duration = None
                 chat.save(update_fields=[
-                    'swapanza_requested_by', 'swapanza_confirmed_users', 
+                    'swapanza_requested_by',
                     'swapanza_requested_at', 'swapanza_duration'
                 ])
                 return True
@@ -1240,12 +1064,19 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return False
 
 
+def broadcast_chat_invalidate(chat_id):
+    """Tell every ChatConsumer of a chat to drop its cached chat (for sync callers)"""
+    async_to_sync(get_channel_layer().group_send)(f'chat_{chat_id}', {
+        'type': 'chat.invalidate'
+    })
+
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(WireProtocolMixin, AsyncWebsocketConsumer):
     async def connect(self):
         import logging
         logger = logging.getLogger(__name__)
-        self.user = await self.get_user_from_token()
+        # Authenticated (and cached) once by TokenAuthMiddleware
+        self.user = self.scope.get('user', None)
         if not self.user or not self.user.is_authenticated:
             logger.warning(f"NotificationConsumer: user not authenticated, closing. user={self.user}")
             await self.close()
@@ -1289,15 +1120,217 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'force_redirect': event.get('force_redirect', True)
         }))
 
-    @database_sync_to_async
-    def get_user_from_token(self):
-        from urllib.parse import parse_qs
-        query_string = self.scope.get('query_string', b'').decode()
-        token = parse_qs(query_string).get('token', [None])[0]
-        if not token:
-            return AnonymousUser()
+
+# Most chats one UserConsumer socket can be subscribed to at once
+MAX_CHAT_STREAMS = 20
+
+
+class ChatStream(ChatConsumer):
+    """A ChatConsumer carried over a UserConsumer socket instead of its own.
+
+    It keeps ChatConsumer's protocol and state but listens on a private,
+    process-local channel of the shared layer, so chat group events still
+    reach it by channel name. Frames it sends are wrapped as ``chat.frame``
+    for its chat and closing it only ends this subscription.
+    """
+
+    def __init__(self, parent, chat_id, last_seq=None):
+        super().__init__()
+        self.parent = parent
+        self.channel_layer = parent.channel_layer
+        # Broadcast frames come pre-encoded for the shared socket's protocol
+        self.subprotocol = parent.subprotocol
+        self.scope = {
+            **parent.scope,
+            'url_route': {'kwargs': {'chat_id': str(chat_id)}},
+            'query_string': f'last_seq={last_seq}'.encode() if last_seq is not None else b'',
+        }
+        self.listener = None
+        self.stopped = False
+        # UserConsumer.subscribe checked access just before starting the stream
+        self.access_checked = True
+        # Client frames and group events are handled one at a time, as on a socket
+        self.lock = asyncio.Lock()
+
+    async def check_access(self):
+        if self.access_checked:
+            self.access_checked = False
+            return None
+        return await super().check_access()
+
+    async def start(self):
+        """Open the private channel and run ChatConsumer.connect on it"""
+        self.channel_name = await self.channel_layer.new_channel()
+        self.listener = asyncio.ensure_future(self.listen())
+        async with self.lock:
+            await self.connect()
+
+    async def listen(self):
+        """Dispatch chat group events until stopped; an event that fails is logged and skipped"""
+        while not self.stopped:
+            try:
+                event = await self.channel_layer.receive(self.channel_name)
+            except Exception as e:
+                # Nothing more can arrive: close the chat so the client resubscribes
+                logger.error(f"ChatStream for chat {self.chat_id} lost its channel: {e}")
+                await self.parent.end_stream(self, 1011)
+                return
+            async with self.lock:
+                try:
+                    await self.dispatch(event)
+                except ValueError as e:
+                    logger.warning(f"ChatStream for chat {self.chat_id}: {e}")
+                except Exception as e:
+                    logger.error(f"ChatStream for chat {self.chat_id} failed on "
+                                 f"{event.get('type')}: {e}\n{traceback.format_exc()}")
+
+    async def route(self, text_data):
+        """Handle a frame the client addressed to this chat"""
+        async with self.lock:
+            await self.receive(text_data=text_data)
+
+    async def stop(self, code):
+        """Leave the chat as a socket disconnect would; safe to call twice"""
+        if self.stopped:
+            return
+        self.stopped = True
+        await self.disconnect(code)
+        if self.listener is not None and self.listener is not asyncio.current_task():
+            self.listener.cancel()
+
+    async def accept(self, subprotocol=None, headers=None):
+        # The shared socket is already open; the init frame confirms the subscription
+        pass
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        chat_id = int(self.chat_id)
+        if bytes_data is not None:
+            await self.parent.send(
+                bytes_data=wrap_msgpack({'type': 'chat.frame', 'chat_id': chat_id}, bytes_data))
+            return
+        await self.parent.send(
+            text_data='{"type": "chat.frame", "chat_id": %d, "frame": %s}' % (chat_id, text_data))
+
+    async def close(self, code=None, reason=None):
+        await self.parent.end_stream(self, code)
+
+
+class UserConsumer(WireProtocolMixin, AsyncWebsocketConsumer):
+    """One socket per user carrying notifications and any number of chats.
+
+    The user is authenticated once, by TokenAuthMiddleware, when the socket
+    opens. Notifications arrive exactly as on NotificationConsumer. Chats are
+    opened and closed in-band::
+
+        {"type": "subscribe", "chat_id": 5, "last_seq": 12}
+        {"type": "unsubscribe", "chat_id": 5}
+
+    Any other frame with a ``chat_id`` is a ChatConsumer frame for that chat
+    (``chat.message``, ``chat.replay``, ``swapanza.*``). Frames from a chat
+    come back as ``{"type": "chat.frame", "chat_id": 5, "frame": {...}}`` and
+    a chat the server closes (unknown chat, Swapanza logout) is reported as
+    ``{"type": "chat.closed", "chat_id": 5, "code": 4004}``. Subscribing to a
+    chat the user is not in gets ``chat.closed`` with code 4003 and reason
+    ``forbidden`` right away.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user', None)
+        self.streams = {}
+
+        if not self.user or not self.user.is_authenticated:
+            logger.warning("UserConsumer: user not authenticated, closing.")
+            await self.close(code=4001)
+            return
+
+        self.group_name = f'user_{self.user.id}'
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        for stream in list(getattr(self, 'streams', {}).values()):
+            try:
+                await stream.stop(code)
+            except Exception as e:
+                logger.error(f"Error closing chat stream {stream.chat_id}: {e}\n{traceback.format_exc()}")
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive(self, text_data):
         try:
-            access_token = AccessToken(token)
-            return User.objects.get(id=access_token['user_id'])
-        except Exception:
-            return AnonymousUser()
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_error('Invalid JSON')
+            return
+
+        message_type = data.get('type', '')
+        if message_type == 'ping':
+            await self.send(text_data=json.dumps({'type': 'pong'}))
+            return
+
+        try:
+            chat_id = int(data.get('chat_id'))
+        except (TypeError, ValueError):
+            await self.send_error('chat_id must be an integer')
+            return
+
+        if message_type == 'subscribe':
+            await self.subscribe(chat_id, data.get('last_seq'))
+        elif message_type == 'unsubscribe':
+            stream = self.streams.get(chat_id)
+            if stream is not None:
+                await self.end_stream(stream, 1000)
+        elif chat_id in self.streams:
+            await self.streams[chat_id].route(text_data)
+        else:
+            await self.send_error(f'Not subscribed to chat {chat_id}')
+
+    async def subscribe(self, chat_id, last_seq=None):
+        """Start a chat stream, replacing an existing one so the client gets a fresh init"""
+        try:
+            last_seq = int(last_seq) if last_seq is not None else None
+        except (TypeError, ValueError):
+            await self.send_error('last_seq must be an integer')
+            return
+
+        close_code = await database_sync_to_async(chat_access_code)(chat_id, self.user.id)
+        if close_code is not None:
+            await self.send_chat_closed(chat_id, close_code,
+                                        'forbidden' if close_code == 4003 else 'not found')
+            return
+
+        if chat_id in self.streams:
+            await self.streams.pop(chat_id).stop(1000)
+        elif len(self.streams) >= MAX_CHAT_STREAMS:
+            await self.send_error(f'At most {MAX_CHAT_STREAMS} chats can be open at once')
+            return
+
+        stream = ChatStream(self, chat_id, last_seq)
+        self.streams[chat_id] = stream
+        await stream.start()
+
+    async def end_stream(self, stream, code):
+        """Stop a stream and tell the client its chat is closed"""
+        if self.streams.get(int(stream.chat_id)) is stream:
+            del self.streams[int(stream.chat_id)]
+        await stream.stop(code)
+        await self.send_chat_closed(int(stream.chat_id), code)
+
+    async def send_chat_closed(self, chat_id, code, reason=None):
+        frame = {'type': 'chat.closed', 'chat_id': chat_id, 'code': code}
+        if reason is not None:
+            frame['reason'] = reason
+        await self.send(text_data=json.dumps(frame))
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({'type': 'error', 'message': message}))
+
+    async def notify(self, event):
+        await self.send(text_data=json.dumps(event['data']))
+
+    async def swapanza_logout(self, event):
+        """Forward the user's Swapanza logout, as NotificationConsumer does"""
+        await self.send(text_data=json.dumps({
+            'type': 'swapanza.logout',
+            'force_redirect': event.get('force_redirect', True)
+        }))
@@ -19,12 +19,10 @@ class Command(BaseCommand):
             self.stdout.write(f'Clearing stale invite in chat {chat.id} from {chat.swapanza_requested_by}')
             chat.swapanza_requested_by = None
             chat.swapanza_requested_at = None
-            chat.swapanza_confirmed_users = []
             chat.swapanza_duration = None
             chat.save(update_fields=[
                 'swapanza_requested_by', 
                 'swapanza_requested_at', 
-                'swapanza_confirmed_users',
                 'swapanza_duration'
             ])
             count += 1
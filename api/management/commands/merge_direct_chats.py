@@ -0,0 +1,102 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.message_buffer import refill_buffer
+from api.models import Chat, ChatMembership, Message, SwapanzaSession
+
+
+def unkeyed_direct_chats():
+    """``(chat_id, direct_key)`` for two-person chats without a direct_key, oldest first"""
+    Participant = Chat.participants.through
+    current_chat, user_ids = None, []
+    rows = Participant.objects.filter(chat__direct_key__isnull=True).order_by(
+        'chat_id', 'user_id').values_list('chat_id', 'user_id')
+    for chat_id, user_id in rows.iterator(chunk_size=2000):
+        if chat_id != current_chat:
+            if len(user_ids) == 2:
+                yield current_chat, Chat.direct_key_for(*user_ids)
+            current_chat, user_ids = chat_id, []
+        user_ids.append(user_id)
+    if len(user_ids) == 2:
+        yield current_chat, Chat.direct_key_for(*user_ids)
+
+
+def merge_chats(kept_id, duplicate_id):
+    """Move every message, membership counter and Swapanza session of the duplicate
+    into the kept chat, renumber the kept chat's ``seq`` and delete the duplicate.
+
+    Returns the number of messages moved.
+    """
+    with transaction.atomic():
+        chats = {chat.id: chat for chat in Chat.objects.select_for_update().filter(
+            id__in=[kept_id, duplicate_id])}
+        kept, duplicate = chats[kept_id], chats[duplicate_id]
+
+        messages = list(Message.objects.filter(chat_id__in=[kept_id, duplicate_id]).order_by(
+            'created_at', 'id').only('id', 'chat', 'created_at'))
+        moved = sum(1 for message in messages if message.chat_id == duplicate_id)
+
+        # Renumber in two passes so no intermediate (chat, seq) collides
+        offset = max(kept.last_seq, duplicate.last_seq, len(messages))
+        for base in (offset, 0):
+            for position, message in enumerate(messages, start=1):
+                message.chat_id = kept_id
+                message.seq = base + position
+            Message.objects.bulk_update(messages, ['chat', 'seq'], batch_size=2000)
+        Chat.objects.filter(id=kept_id).update(last_seq=len(messages))
+
+        last_message = messages[-1] if messages else None
+        others = {membership.user_id: membership
+                  for membership in ChatMembership.objects.filter(chat_id=duplicate_id)}
+        for membership in ChatMembership.objects.select_for_update().filter(chat_id=kept_id):
+            other = others.get(membership.user_id)
+            if other is None:
+                continue
+            membership.unread_count += other.unread_count
+            if other.last_read_at and (membership.last_read_at is None
+                                       or other.last_read_at > membership.last_read_at):
+                membership.last_read_at = other.last_read_at
+                membership.last_read_message_id = other.last_read_message_id
+            if last_message is not None:
+                membership.last_message_id = last_message.id
+            membership.last_activity_at = max(membership.last_activity_at, other.last_activity_at)
+            membership.save(update_fields=['unread_count', 'last_read_at', 'last_read_message',
+                                           'last_message', 'last_activity_at'])
+
+        SwapanzaSession.objects.filter(chat_id=duplicate_id).update(chat_id=kept_id)
+        duplicate.delete()
+
+        # Buffered messages carry the old seq numbers
+        transaction.on_commit(lambda: (refill_buffer(kept_id, []), refill_buffer(duplicate_id, [])))
+    return moved
+
+
+class Command(BaseCommand):
+    help = 'Merge duplicate direct chats into the one holding the pair\'s direct_key'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the chats that would be merged')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        merged = keyed = 0
+
+        for chat_id, key in list(unkeyed_direct_chats()):
+            kept_id = Chat.objects.filter(direct_key=key).values_list('id', flat=True).first()
+            if kept_id is None:
+                # No keyed chat for this pair (it was deleted): this one becomes it
+                self.stdout.write(f'Keying chat {chat_id} as {key}')
+                if not dry_run:
+                    Chat.objects.filter(id=chat_id, direct_key__isnull=True).update(direct_key=key)
+                keyed += 1
+                continue
+
+            self.stdout.write(f'Merging chat {chat_id} into chat {kept_id} ({key})')
+            if not dry_run:
+                moved = merge_chats(kept_id, chat_id)
+                self.stdout.write(f'  moved {moved} messages')
+            merged += 1
+
+        verb = 'Would merge' if dry_run else 'Merged'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {merged} duplicate chats and keyed {keyed} chats'))
@@ -0,0 +1,161 @@
+"""Bounded buffer of the newest serialized messages of each active chat.
+
+Opening a chat reads its newest page of messages, so writers push every new
+message (as ``MessageSerializer`` data) here and readers serve that page, or
+a short reconnect replay, without querying ``Message``. Buffers expire after
+``IDLE_TTL`` seconds without activity.
+
+The buffer is a cache, not a log: a push can be lost (Redis restart, failed
+write) or land out of order. Readers therefore only trust a run of messages
+that is contiguous in ``seq`` down from the chat's ``last_seq``, and rebuild
+the buffer from the database when it has a hole.
+
+Redis (``REDIS_URL``) is used when configured; otherwise an in-process buffer
+is used, which is only correct for a single process (tests, local dev).
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = 50
+IDLE_TTL = 15 * 60
+
+
+def buffer_key(chat_id):
+    return f'chat:{chat_id}:recent'
+
+
+def contiguous_run(messages, last_seq, count):
+    """The ``count`` messages ending at ``last_seq``, newest first, or None if any is missing"""
+    by_seq = {message['seq']: message for message in messages}
+    wanted = range(last_seq, max(last_seq - count, 0), -1)
+    if any(seq not in by_seq for seq in wanted):
+        return None
+    return [by_seq[seq] for seq in wanted]
+
+
+class RedisMessageBuffer:
+    """Per-chat Redis lists of JSON-encoded messages, newest first"""
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+
+    def push(self, chat_id, message):
+        key = buffer_key(chat_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lpush(key, json.dumps(message))
+        pipe.ltrim(key, 0, BUFFER_SIZE - 1)
+        pipe.expire(key, IDLE_TTL)
+        pipe.execute()
+
+    def get(self, chat_id):
+        """Buffered messages, newest first as pushed; empty when cold"""
+        key = buffer_key(chat_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lrange(key, 0, -1)
+        pipe.expire(key, IDLE_TTL)
+        entries, _ = pipe.execute()
+        return [json.loads(entry) for entry in entries]
+
+    def replace(self, chat_id, messages):
+        """Rebuild the buffer from ``messages`` (newest first) read from the database"""
+        key = buffer_key(chat_id)
+        pipe = self.redis.pipeline()
+        pipe.delete(key)
+        if messages:
+            pipe.rpush(key, *(json.dumps(message) for message in messages[:BUFFER_SIZE]))
+            pipe.expire(key, IDLE_TTL)
+        pipe.execute()
+
+
+class InMemoryMessageBuffer:
+    """Process-local fallback with the same interface as RedisMessageBuffer"""
+
+    max_chats = 1000
+
+    def __init__(self):
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _touch(self, chat_id):
+        key = buffer_key(chat_id)
+        entry = self._buffers.get(key)
+        if entry is None or entry[1] <= time.time():
+            entry = (deque(maxlen=BUFFER_SIZE), None)
+        entry = (entry[0], time.time() + IDLE_TTL)
+        self._buffers[key] = entry
+        self._buffers.move_to_end(key)
+        while len(self._buffers) > self.max_chats:
+            self._buffers.popitem(last=False)
+        return entry[0]
+
+    def push(self, chat_id, message):
+        with self._lock:
+            self._touch(chat_id).appendleft(message)
+
+    def get(self, chat_id):
+        with self._lock:
+            return list(self._touch(chat_id))
+
+    def replace(self, chat_id, messages):
+        with self._lock:
+            buffer = self._touch(chat_id)
+            buffer.clear()
+            buffer.extend(messages[:BUFFER_SIZE])
+
+
+_buffer = None
+
+
+def get_message_buffer():
+    """Return the process-wide message buffer, Redis-backed when REDIS_URL is set"""
+    global _buffer
+    if _buffer is None:
+        redis_url = getattr(settings, 'REDIS_URL', None)
+        _buffer = RedisMessageBuffer(redis_url) if redis_url else InMemoryMessageBuffer()
+    return _buffer
+
+
+def buffer_message(message):
+    """Push a newly created message once its transaction commits.
+
+    Pushing before the commit could leave a rolled-back message (and its
+    ``seq``, which the next message reuses) in the buffer.
+    """
+    from .serializers import MessageSerializer
+    data = MessageSerializer(message).data
+
+    def push():
+        try:
+            get_message_buffer().push(message.chat_id, data)
+        except Exception as e:
+            logger.warning(f"Could not buffer message {message.id}: {e}")
+
+    transaction.on_commit(push)
+
+
+def get_recent_messages(chat_id, last_seq, count):
+    """Newest ``count`` messages of a chat whose newest is ``last_seq``, or None on a miss"""
+    if last_seq <= 0:
+        return []
+    try:
+        return contiguous_run(get_message_buffer().get(chat_id), last_seq, count)
+    except Exception as e:
+        logger.warning(f"Could not read message buffer of chat {chat_id}: {e}")
+        return None
+
+
+def refill_buffer(chat_id, messages):
+    """Replace a chat's buffer with ``messages`` (serialized, newest first) after a miss"""
+    try:
+        get_message_buffer().replace(chat_id, messages)
+    except Exception as e:
+        logger.warning(f"Could not refill message buffer of chat {chat_id}: {e}")
@@ -2,7 +2,10 @@ from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.tokens import AccessToken, TokenError
+from .authentication import CachedJWTAuthentication
 from urllib.parse import parse_qs
 import logging
 logger = logging.getLogger(__name__)
@@ -11,11 +14,11 @@ User = get_user_model()
 
 @database_sync_to_async
 def get_user(token_key):
+    """The token's user, checked and cached exactly as for HTTP requests"""
     try:
         access_token = AccessToken(token_key)
-        user = User.objects.get(id=access_token['user_id'])
-        return user
-    except (TokenError, User.DoesNotExist, KeyError) as e:
+        return CachedJWTAuthentication().get_user(access_token)
+    except (TokenError, AuthenticationFailed, InvalidToken) as e:
         logger.warning(f"Token authentication error: {str(e)}")
         return AnonymousUser()
     except Exception as e:
@@ -0,0 +1,60 @@
+# Generated by Django 5.1.6 on 2026-10-17 14:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def copy_read_by_to_watermarks(apps, schema_editor):
+    """Collapse Message.read_by rows into one watermark per (chat, user)"""
+    Message = apps.get_model('chat', 'Message')
+    ChatMembership = apps.get_model('chat', 'ChatMembership')
+    ReadBy = Message._meta.get_field('read_by').remote_field.through
+
+    watermarks = ReadBy.objects.values('user_id', 'message__chat_id').annotate(
+        last_read_message_id=Max('message_id'),
+        last_read_at=Max('message__created_at'),
+    ).order_by()
+
+    batch = []
+    for row in watermarks.iterator(chunk_size=2000):
+        batch.append(ChatMembership(
+            chat_id=row['message__chat_id'],
+            user_id=row['user_id'],
+            last_read_message_id=row['last_read_message_id'],
+            last_read_at=row['last_read_at'],
+        ))
+        if len(batch) >= 2000:
+            ChatMembership.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        ChatMembership.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0022_message_apparent_sender_profile_image_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_at', models.DateTimeField(blank=True, null=True)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='chat.chat')),
+                ('last_read_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('chat', 'user'), name='unique_chat_membership')],
+            },
+        ),
+        migrations.RunPython(copy_read_by_to_watermarks, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='message',
+            name='read_by',
+        ),
+    ]
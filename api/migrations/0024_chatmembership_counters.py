@@ -0,0 +1,73 @@
+# Generated by Django 5.1.6 on 2026-10-17 14:48
+
+import datetime
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_memberships(apps, schema_editor):
+    """Create a membership for every participant and compute its counters"""
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    ChatMembership = apps.get_model('chat', 'ChatMembership')
+    Participant = Chat._meta.get_field('participants').remote_field.through
+
+    batch = []
+    for row in Participant.objects.values('chat_id', 'user_id', 'chat__created_at').iterator(chunk_size=2000):
+        batch.append(ChatMembership(
+            chat_id=row['chat_id'],
+            user_id=row['user_id'],
+            last_activity_at=row['chat__created_at'],
+        ))
+        if len(batch) >= 2000:
+            ChatMembership.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        ChatMembership.objects.bulk_create(batch, ignore_conflicts=True)
+
+    latest = Message.objects.filter(chat=OuterRef('chat')).order_by('-created_at')
+    chat_created_at = Chat.objects.filter(pk=OuterRef('chat')).values('created_at')[:1]
+    unread = Message.objects.filter(
+        chat=OuterRef('chat'),
+        created_at__gt=Coalesce(OuterRef('last_read_at'), Value(datetime.datetime.min.replace(tzinfo=datetime.timezone.utc))),
+    ).exclude(sender=OuterRef('user')).order_by().values('chat').annotate(
+        count=Count('id')).values('count')
+
+    ChatMembership.objects.update(
+        last_message_id=Subquery(latest.values('id')[:1]),
+        last_activity_at=Coalesce(Subquery(latest.values('created_at')[:1]), Subquery(chat_created_at)),
+        unread_count=Coalesce(Subquery(unread), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0023_chatmembership'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmembership',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='chatmembership',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='chatmembership',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chatmembership',
+            index=models.Index(fields=['user', '-last_activity_at'], name='chat_chatme_user_id_70dd03_idx'),
+        ),
+        migrations.RunPython(backfill_memberships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.6 on 2026-10-17 14:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def copy_swapanza_state_to_participants(apps, schema_editor):
+    """Turn the JSON confirmations and message counts of pending or active Swapanzas into rows"""
+    Chat = apps.get_model('chat', 'Chat')
+    SwapanzaParticipant = apps.get_model('chat', 'SwapanzaParticipant')
+
+    now = timezone.now()
+    chats = Chat.objects.filter(swapanza_requested_by__isnull=False).prefetch_related('participants')
+    batch = []
+    for chat in chats.iterator(chunk_size=500):
+        confirmed = {str(user_id) for user_id in chat.swapanza_confirmed_users or []}
+        counts = chat.swapanza_message_count or {}
+        for user in chat.participants.all():
+            batch.append(SwapanzaParticipant(
+                chat_id=chat.id,
+                user_id=user.id,
+                confirmed_at=now if str(user.id) in confirmed else None,
+                message_count=counts.get(str(user.id), 0) if chat.swapanza_active else 0,
+            ))
+    SwapanzaParticipant.objects.bulk_create(batch, batch_size=2000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0024_chatmembership_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SwapanzaParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('confirmed_at', models.DateTimeField(blank=True, null=True)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='swapanza_participants', to='chat.chat')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='swapanza_participations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('chat', 'user'), name='unique_swapanza_participant')],
+            },
+        ),
+        migrations.RunPython(copy_swapanza_state_to_participants, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='chat',
+            name='swapanza_confirmed_users',
+        ),
+        migrations.RemoveField(
+            model_name='chat',
+            name='swapanza_message_count',
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.6 on 2026-10-17 15:02
+
+from django.db import migrations, models
+
+
+def number_existing_messages(apps, schema_editor):
+    """Number each chat's messages 1..n by (created_at, id) and record the last number"""
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+
+    for chat_id in Chat.objects.values_list('id', flat=True).iterator(chunk_size=2000):
+        batch = []
+        seq = 0
+        for message_id in Message.objects.filter(chat_id=chat_id).order_by(
+                'created_at', 'id').values_list('id', flat=True).iterator(chunk_size=2000):
+            seq += 1
+            batch.append(Message(id=message_id, seq=seq))
+            if len(batch) >= 2000:
+                Message.objects.bulk_update(batch, ['seq'])
+                batch = []
+        if batch:
+            Message.objects.bulk_update(batch, ['seq'])
+        if seq:
+            Chat.objects.filter(id=chat_id).update(last_seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0025_swapanzaparticipant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(number_existing_messages, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveIntegerField(editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('chat', 'seq'), name='unique_message_seq'),
+        ),
+    ]
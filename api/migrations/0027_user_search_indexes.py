@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Expressions must match the ones user_search filters and orders by
+CREATE_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS chat_user_search_key ON chat_user '
+    '((UPPER(username::text)) COLLATE "C", id)',
+    'CREATE INDEX IF NOT EXISTS chat_user_search_trgm ON chat_user '
+    'USING gin (UPPER(username::text) gin_trgm_ops)',
+]
+
+DROP_INDEXES = [
+    'DROP INDEX IF EXISTS chat_user_search_trgm',
+    'DROP INDEX IF EXISTS chat_user_search_key',
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    """Username search indexes; PostgreSQL only, other databases search unindexed"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_INDEXES:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0026_message_seq'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
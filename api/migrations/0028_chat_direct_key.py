@@ -0,0 +1,49 @@
+from django.db import migrations, models
+
+
+def direct_chat_pairs(Chat):
+    """``(chat_id, direct_key)`` for every chat with exactly two participants, by chat id"""
+    Participant = Chat.participants.through
+    current_chat, user_ids = None, []
+    rows = Participant.objects.order_by('chat_id', 'user_id').values_list('chat_id', 'user_id')
+    for chat_id, user_id in rows.iterator(chunk_size=2000):
+        if chat_id != current_chat:
+            if len(user_ids) == 2:
+                yield current_chat, f"{user_ids[0]}:{user_ids[1]}"
+            current_chat, user_ids = chat_id, []
+        user_ids.append(user_id)
+    if len(user_ids) == 2:
+        yield current_chat, f"{user_ids[0]}:{user_ids[1]}"
+
+
+def set_direct_keys(apps, schema_editor):
+    """Key the oldest chat of each pair; duplicates stay unkeyed for merge_direct_chats"""
+    Chat = apps.get_model('chat', 'Chat')
+    seen = set()
+    batch = []
+    for chat_id, key in direct_chat_pairs(Chat):
+        if key in seen:
+            continue
+        seen.add(key)
+        batch.append(Chat(id=chat_id, direct_key=key))
+        if len(batch) >= 2000:
+            Chat.objects.bulk_update(batch, ['direct_key'])
+            batch = []
+    if batch:
+        Chat.objects.bulk_update(batch, ['direct_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0027_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='direct_key',
+            field=models.CharField(blank=True, max_length=41, null=True, unique=True),
+        ),
+        migrations.RunPython(set_direct_keys, migrations.RunPython.noop),
+    ]
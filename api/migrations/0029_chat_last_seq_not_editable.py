@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 15:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0028_chat_direct_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chat',
+            name='last_seq',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
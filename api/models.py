@@ -1,5 +1,6 @@
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, When
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.utils import timezone
@@ -16,40 +17,115 @@ class User(AbstractUser):
 class Chat(models.Model):
     participants = models.ManyToManyField(User, related_name='chats')
     created_at = models.DateTimeField(auto_now_add=True)
+    # "<lower user id>:<higher user id>" for a two-person chat, None for groups;
+    # unique, so each pair has at most one direct chat
+    direct_key = models.CharField(max_length=41, null=True, blank=True, unique=True)
 
     # Swapanza fields
     swapanza_requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='swapanza_requests')
     swapanza_duration = models.IntegerField(default=5, null=True, blank=True)
-    swapanza_confirmed_users = models.JSONField(default=list, null=True, blank=True)
     swapanza_active = models.BooleanField(default=False)
     swapanza_started_at = models.DateTimeField(null=True, blank=True)
     swapanza_ends_at = models.DateTimeField(null=True, blank=True)
-    swapanza_message_count = models.JSONField(default=dict, null=True, blank=True)
     swapanza_requested_at = models.DateTimeField(null=True, blank=True)
+    # Highest Message.seq handed out in this chat; only Message.save advances it
+    last_seq = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return f"Chat {self.id} between {self.participants.count()} users"
-    
-    def reset_swapanza(self):
-        """Reset all Swapanza-related fields"""
-        self.swapanza_active = False
-        self.swapanza_requested_by = None
-        self.swapanza_started_at = None
-        self.swapanza_ends_at = None
-        self.swapanza_message_count = {}
-        self.swapanza_confirmed_users = []
-        self.save()
+
+    def save(self, *args, **kwargs):
+        # A stale instance must not write back an older last_seq: the next
+        # message would reuse a seq and hit the unique constraint
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'last_seq']
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def direct_key_for(user_id, other_user_id):
+        low, high = sorted((int(user_id), int(other_user_id)))
+        return f"{low}:{high}"
+
+    @classmethod
+    def get_or_create_direct(cls, user_id, other_user_id):
+        """The two users' direct chat, created if missing: ``(chat, created)``.
+
+        Found with one lookup on the unique ``direct_key``. A concurrent
+        creation for the same pair fails on that index instead of making a
+        second chat, and the loser returns the winner's chat.
+        """
+        key = cls.direct_key_for(user_id, other_user_id)
+        chat = cls.objects.filter(direct_key=key).first()
+        if chat is not None:
+            return chat, False
+
+        user_ids = [int(user_id), int(other_user_id)]
+        try:
+            with transaction.atomic():
+                chat = cls.objects.create(direct_key=key)
+                chat.participants.add(*user_ids)
+                ChatMembership.create_for_chat(chat, user_ids)
+        except IntegrityError:
+            return cls.objects.get(direct_key=key), False
+        return chat, True
+
+    @classmethod
+    def create_with_participants(cls, user_ids):
+        """A new chat of ``user_ids`` (direct_key is left unset; see get_or_create_direct)"""
+        with transaction.atomic():
+            chat = cls.objects.create()
+            chat.participants.add(*user_ids)
+            ChatMembership.create_for_chat(chat, user_ids)
+        return chat
+
+    # Confirmations and message counts live in SwapanzaParticipant; these keep
+    # the old JSON shapes for API responses and use prefetched rows when present.
+    @property
+    def swapanza_confirmed_users(self):
+        if not self.swapanza_requested_by_id:
+            return []
+        return [str(p.user_id) for p in self.swapanza_participants.all()
+                if p.confirmed_at is not None]
+
+    @property
+    def swapanza_message_count(self):
+        if not self.swapanza_active:
+            return {}
+        return {str(p.user_id): p.message_count
+                for p in self.swapanza_participants.all()}
+
+    @classmethod
+    def end_swapanza(cls, **filters):
+        """Clear all Swapanza state on the matching chats with a single UPDATE.
+
+        Callers filter on the state they expect to end (e.g. a given
+        ``swapanza_ends_at``), so repeating the call changes nothing.
+        Returns the number of chats changed.
+        """
+        return cls.objects.filter(**filters).update(
+            swapanza_active=False,
+            swapanza_requested_by=None,
+            swapanza_requested_at=None,
+            swapanza_duration=None,
+            swapanza_started_at=None,
+            swapanza_ends_at=None)
 
 class Message(models.Model):
+    """A chat message.
+
+    ``seq`` numbers the messages of a chat 1, 2, 3... in commit order with no
+    gaps, so clients can ask for exactly what they missed and spot holes.
+    """
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    read_by = models.ManyToManyField(User, related_name='read_messages', blank=True)
     during_swapanza = models.BooleanField(default=False)
     apparent_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='apparent_messages')
     apparent_sender_username = models.CharField(max_length=150, blank=True, null=True)
     apparent_sender_profile_image = models.CharField(max_length=500, blank=True, null=True)
+    seq = models.PositiveIntegerField(editable=False)
 
 
     class Meta:
@@ -58,12 +134,171 @@ class Message(models.Model):
             models.Index(fields=['chat', 'created_at']),
             models.Index(fields=['sender', 'during_swapanza']),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'seq'], name='unique_message_seq'),
+        ]
     
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            # The UPDATE row-locks the chat until commit, serializing writers per chat
+            Chat.objects.filter(id=self.chat_id).update(last_seq=F('last_seq') + 1)
+            self.seq = Chat.objects.filter(id=self.chat_id).values_list('last_seq', flat=True).get()
+            super().save(*args, **kwargs)
+            ChatMembership.record_message(self)
+
     def __str__(self):
         return f"Message {self.id} from {self.sender.username} in chat {self.chat.id}"
 
 
 
+class ChatMembership(models.Model):
+    """Per-user state for a chat participant: read watermark and maintained counters.
+
+    Every message in the chat created at or before ``last_read_at`` counts as
+    read by ``user``. ``unread_count``, ``last_message`` and ``last_activity_at``
+    are kept up to date in the same transaction that saves a message, so
+    unread badges and the chat list never aggregate over ``Message``.
+    """
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='memberships')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_memberships')
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+    last_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_activity_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'user'], name='unique_chat_membership'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_activity_at']),
+        ]
+
+    def __str__(self):
+        return f"Membership of user {self.user_id} in chat {self.chat_id}"
+
+    @classmethod
+    def create_for_chat(cls, chat, user_ids):
+        """Create missing membership rows for the given participants"""
+        cls.objects.bulk_create(
+            [cls(chat=chat, user_id=user_id, last_activity_at=chat.created_at)
+             for user_id in user_ids],
+            ignore_conflicts=True)
+
+    @classmethod
+    def record_message(cls, message):
+        """Bump counters for a newly saved message; runs in the message's transaction.
+
+        Whoever saved the message pushes the new counts (see api.user_state).
+        """
+        cls.objects.filter(chat_id=message.chat_id).update(
+            unread_count=Case(
+                When(user_id=message.sender_id, then=F('unread_count')),
+                default=F('unread_count') + 1),
+            last_message_id=message.id,
+            last_activity_at=message.created_at)
+
+    @classmethod
+    def mark_read(cls, user_id, chat_id=None):
+        """Reset the user's unread counters and move their watermarks to the last message.
+
+        Limited to one chat when ``chat_id`` is given. Returns the number of
+        messages that were unread; the caller pushes the reset if it's non-zero.
+        """
+        memberships = cls.objects.filter(user_id=user_id, unread_count__gt=0)
+        if chat_id is not None:
+            memberships = memberships.filter(chat_id=chat_id)
+
+        cleared = memberships.aggregate(total=Sum('unread_count'))['total'] or 0
+        if cleared:
+            memberships.update(unread_count=0,
+                               last_read_message=F('last_message'),
+                               last_read_at=F('last_activity_at'))
+        return cleared
+
+    @classmethod
+    def mark_read_chunk(cls, user_id, limit):
+        """Like ``mark_read`` for all chats, but for at most ``limit`` counters.
+
+        Returns ``(messages_cleared, counters_cleared)``; fewer than ``limit``
+        counters cleared means none are left. Nothing is pushed, the caller
+        reports the reset once every chunk is done.
+        """
+        with transaction.atomic():
+            counters = list(cls.objects.select_for_update().filter(
+                user_id=user_id, unread_count__gt=0).order_by('id').values_list(
+                    'id', 'unread_count')[:limit])
+            if counters:
+                cls.objects.filter(id__in=[membership_id for membership_id, _ in counters]).update(
+                    unread_count=0,
+                    last_read_message=F('last_message'),
+                    last_read_at=F('last_activity_at'))
+        return sum(count for _, count in counters), len(counters)
+
+
+class SwapanzaParticipant(models.Model):
+    """A chat participant's part in the chat's current Swapanza invite.
+
+    Rows are recreated for every participant when an invite is made, so they
+    describe the pending invite while ``Chat.swapanza_requested_by`` is set and
+    the running Swapanza while ``Chat.swapanza_active`` is. Each change is a
+    single conditional UPDATE on one row, so concurrent confirmations and
+    messages never overwrite each other.
+    """
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='swapanza_participants')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='swapanza_participations')
+    confirmed_at = models.DateTimeField(null=True, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat', 'user'], name='unique_swapanza_participant'),
+        ]
+
+    def __str__(self):
+        return f"Swapanza participant {self.user_id} in chat {self.chat_id}"
+
+    @classmethod
+    def start_invite(cls, chat_id, user_ids, requested_by_id):
+        """Replace the chat's rows with fresh ones; the requester is confirmed already"""
+        now = timezone.now()
+        with transaction.atomic():
+            cls.objects.filter(chat_id=chat_id).delete()
+            cls.objects.bulk_create([
+                cls(chat_id=chat_id,
+                    user_id=user_id,
+                    confirmed_at=now if user_id == requested_by_id else None)
+                for user_id in user_ids
+            ])
+
+    @classmethod
+    def confirm(cls, chat_id, user_id):
+        """Confirm the user; returns False if they had confirmed already or are not invited"""
+        return cls.objects.filter(chat_id=chat_id, user_id=user_id,
+                                  confirmed_at__isnull=True).update(
+                                      confirmed_at=timezone.now()) > 0
+
+    @classmethod
+    def all_confirmed(cls, chat_id):
+        """True once the chat has an invite and every invited participant confirmed it"""
+        counts = cls.objects.filter(chat_id=chat_id).aggregate(
+            total=Count('id'), pending=Count('id', filter=Q(confirmed_at__isnull=True)))
+        return counts['total'] > 0 and counts['pending'] == 0
+
+    @classmethod
+    def reset_message_counts(cls, chat_id):
+        cls.objects.filter(chat_id=chat_id).update(message_count=0)
+
+    @classmethod
+    def record_message(cls, chat_id, user_id):
+        cls.objects.filter(chat_id=chat_id, user_id=user_id).update(
+            message_count=F('message_count') + 1)
+
+
 class SwapanzaSession(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='swapanza_sessions')
     partner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='swapanza_partners')
@@ -5,4 +5,5 @@ from .consumers import NotificationConsumer
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<chat_id>\d+)/$', consumers.ChatConsumer.as_asgi()),
     re_path(r"^ws/notifications/?$", NotificationConsumer.as_asgi()),
+    re_path(r'^ws/user/?$', consumers.UserConsumer.as_asgi()),
 ]
\ No newline at end of file
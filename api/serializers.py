@@ -41,9 +41,9 @@ class UserSerializer(serializers.ModelSerializer):
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
-        fields = ['id', 'sender', 'content', 'created_at', 'during_swapanza', 'apparent_sender', 
+        fields = ['id', 'seq', 'sender', 'content', 'created_at', 'during_swapanza', 'apparent_sender', 
                   'apparent_sender_username', 'apparent_sender_profile_image']
-        read_only_fields = ['id', 'sender']
+        read_only_fields = ['id', 'seq', 'sender']
 
     def create(self, validated_data):
         
@@ -51,25 +51,54 @@ class MessageSerializer(serializers.ModelSerializer):
         sender = validated_data.pop('sender', None)
         return Message.objects.create(chat=chat, sender=sender, **validated_data)
 
+class UserSummarySerializer(serializers.ModelSerializer):
+    """Just enough of a user to render a chat participant"""
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'profile_image_url')
+
+
+class MessagePreviewSerializer(serializers.ModelSerializer):
+    """Last-message preview shown in the chat list"""
+    class Meta:
+        model = Message
+        fields = ['id', 'seq', 'sender', 'content', 'created_at', 'during_swapanza',
+                  'apparent_sender', 'apparent_sender_username']
+
+
 class ChatSerializerLight(serializers.ModelSerializer):
-    """Chat serializer without messages - for list views and initial load"""
-    participants = UserSerializer(many=True, read_only=True)
+    """Chat serializer without messages - for list views and initial load
+
+    ``unread_count``, ``last_activity_at`` and ``last_message_id`` are read from
+    annotations made from the requesting user's ChatMembership. The last
+    messages themselves are expected in ``context['last_messages']`` (an
+    ``in_bulk`` dict) so a page of chats serializes without per-row queries.
+    """
+    participants = UserSummarySerializer(many=True, read_only=True)
     participants_usernames = serializers.SerializerMethodField()
     swapanza_requested_by = serializers.SerializerMethodField()
     swapanza_requested_by_username = serializers.SerializerMethodField()
     swapanza_duration = serializers.IntegerField(read_only=True)
     swapanza_requested_at = serializers.DateTimeField(read_only=True)
     swapanza_confirmed_users = serializers.ListField(read_only=True)
+    unread_count = serializers.IntegerField(read_only=True)
+    last_activity_at = serializers.DateTimeField(read_only=True)
+    last_message = serializers.SerializerMethodField()
 
     class Meta:
         model = Chat
         fields = [
             'id', 'participants', 'participants_usernames', 'created_at',
             'swapanza_requested_by', 'swapanza_requested_by_username', 'swapanza_duration',
-            'swapanza_requested_at', 'swapanza_confirmed_users'
+            'swapanza_requested_at', 'swapanza_confirmed_users',
+            'unread_count', 'last_activity_at', 'last_message'
         ]
         read_only_fields = ['id', 'created_at']
 
+    def get_last_message(self, obj):
+        message = self.context.get('last_messages', {}).get(getattr(obj, 'last_message_id', None))
+        return MessagePreviewSerializer(message).data if message else None
+
     def get_participants_usernames(self, obj):
         return [user.username for user in obj.participants.all()]
 
@@ -110,12 +139,23 @@ class ChatSerializer(serializers.ModelSerializer):
         return obj.swapanza_requested_by.username if obj.swapanza_requested_by else None
 
     def create(self, validated_data):
+        """Find or create the direct chat of two participants, or create a group chat.
+
+        Sets ``created`` to whether a new chat was made.
+        """
         participants = validated_data.pop('participants', [])
-        chat = Chat.objects.create()
-        for participant_id in participants:
-            try:
-                participant = User.objects.get(pk=participant_id)
-                chat.participants.add(participant)
-            except User.DoesNotExist:
-                raise serializers.ValidationError(f"User with id {participant_id} not found.")
-        return chat
\ No newline at end of file
+        try:
+            user_ids = sorted({int(participant_id) for participant_id in participants})
+        except (TypeError, ValueError):
+            raise serializers.ValidationError("Participants must be user ids.")
+
+        found = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        if missing:
+            raise serializers.ValidationError(f"User with id {missing[0]} not found.")
+
+        if len(user_ids) == 2:
+            chat, self.created = Chat.get_or_create_direct(*user_ids)
+            return chat
+        self.created = True
+        return Chat.create_with_participants(user_ids)
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""Hot Swapanza state kept outside the database.
+
+Message quotas for an active Swapanza session are counted here with atomic
+increments that expire when the session ends, so the per-message limit check
+is O(1) and race-free. The database stays the durable record: counters are
+seeded from ``Message`` rows whenever a key is missing (first message of a
+session, Redis restart or eviction).
+
+Redis (``REDIS_URL``) is used when configured; otherwise an in-process store
+is used, which is only correct for a single process (tests, local dev).
+"""
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+SWAPANZA_MESSAGE_LIMIT = 2
+
+# Returns -2 when a counter needs seeding, -1 when the quota is used up,
+# otherwise the new per-chat count.
+RESERVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 or redis.call('EXISTS', KEYS[2]) == 0 then
+    return -2
+end
+local count = redis.call('INCR', KEYS[1])
+if count > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return -1
+end
+redis.call('INCR', KEYS[2])
+return count
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) and tonumber(redis.call('GET', KEYS[1])) > 0 then
+    redis.call('DECR', KEYS[1])
+end
+if redis.call('GET', KEYS[2]) and tonumber(redis.call('GET', KEYS[2])) > 0 then
+    redis.call('DECR', KEYS[2])
+end
+return 1
+"""
+
+
+def chat_key(session_id, chat_id):
+    return f'swapanza:{session_id}:chat:{chat_id}'
+
+
+def total_key(session_id):
+    return f'swapanza:{session_id}:total'
+
+
+class RedisSwapanzaStore:
+    """Swapanza counters in Redis, shared by every ASGI node and worker"""
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+        self._reserve = self.redis.register_script(RESERVE_SCRIPT)
+        self._release = self.redis.register_script(RELEASE_SCRIPT)
+
+    def _seed(self, key, value, ends_at):
+        self.redis.set(key, value, nx=True, exat=int(ends_at.timestamp()) + 1)
+
+    def reserve_message(self, session_id, chat_id, limit, ends_at, seed):
+        """Atomically take one message from the session's quota in ``chat_id``.
+
+        ``seed`` is called only when a counter is missing and must return the
+        ``(chat_count, total_count)`` already recorded in the database.
+        Returns the new per-chat count, or None when the limit is reached.
+        """
+        keys = [chat_key(session_id, chat_id), total_key(session_id)]
+        result = self._reserve(keys=keys, args=[limit])
+        if result == -2:
+            chat_count, total_count = seed()
+            self._seed(keys[0], chat_count, ends_at)
+            self._seed(keys[1], total_count, ends_at)
+            result = self._reserve(keys=keys, args=[limit])
+        return None if result < 0 else result
+
+    def release_message(self, session_id, chat_id):
+        """Give back a reserved message whose save failed"""
+        self._release(keys=[chat_key(session_id, chat_id), total_key(session_id)])
+
+    def _get_count(self, key, ends_at, seed):
+        value = self.redis.get(key)
+        if value is None:
+            value = seed()
+            self._seed(key, value, ends_at)
+        return int(value)
+
+    def get_chat_count(self, session_id, chat_id, ends_at, seed):
+        """Messages sent in ``chat_id`` during the session"""
+        return self._get_count(chat_key(session_id, chat_id), ends_at, seed)
+
+    def get_total_count(self, session_id, ends_at, seed):
+        """Messages sent across all chats during the session"""
+        return self._get_count(total_key(session_id), ends_at, seed)
+
+
+class InMemorySwapanzaStore:
+    """Process-local fallback with the same interface as RedisSwapanzaStore"""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._values[key]
+            return None
+        return value
+
+    def _seed(self, key, value, ends_at):
+        if self._get(key) is None:
+            self._values[key] = (value, ends_at.timestamp())
+
+    def reserve_message(self, session_id, chat_id, limit, ends_at, seed):
+        keys = chat_key(session_id, chat_id), total_key(session_id)
+        with self._lock:
+            if self._get(keys[0]) is None or self._get(keys[1]) is None:
+                chat_count, total_count = seed()
+                self._seed(keys[0], chat_count, ends_at)
+                self._seed(keys[1], total_count, ends_at)
+
+            count, expires_at = self._values[keys[0]]
+            if count >= limit:
+                return None
+            self._values[keys[0]] = (count + 1, expires_at)
+            total, expires_at = self._values[keys[1]]
+            self._values[keys[1]] = (total + 1, expires_at)
+            return count + 1
+
+    def release_message(self, session_id, chat_id):
+        with self._lock:
+            for key in (chat_key(session_id, chat_id), total_key(session_id)):
+                value = self._get(key)
+                if value:
+                    self._values[key] = (value - 1, self._values[key][1])
+
+    def _get_count(self, key, ends_at, seed):
+        with self._lock:
+            value = self._get(key)
+            if value is None:
+                value = seed()
+                self._seed(key, value, ends_at)
+            return value
+
+    def get_chat_count(self, session_id, chat_id, ends_at, seed):
+        return self._get_count(chat_key(session_id, chat_id), ends_at, seed)
+
+    def get_total_count(self, session_id, ends_at, seed):
+        return self._get_count(total_key(session_id), ends_at, seed)
+
+
+_store = None
+
+
+def get_swapanza_store():
+    """Return the process-wide Swapanza store, Redis-backed when REDIS_URL is set"""
+    global _store
+    if _store is None:
+        redis_url = getattr(settings, 'REDIS_URL', None)
+        _store = RedisSwapanzaStore(redis_url) if redis_url else InMemorySwapanzaStore()
+    return _store
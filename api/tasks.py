@@ -1,146 +1,209 @@
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from .models import SwapanzaSession, Chat
+from django.utils.dateparse import parse_datetime
+from .models import ChatMembership, SwapanzaSession, Chat
+from .user_state import publish_reset_progress, publish_swapanza_state, publish_unread_cleared
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+import asyncio
 import logging
 logger = logging.getLogger(__name__)
 
+# Pending invites nobody acted on are withdrawn after this long
+STALE_INVITE_TIMEOUT = timezone.timedelta(minutes=10)
+
+
+def _schedule(task, args, eta):
+    """Queue ``task`` to run at ``eta``; the periodic sweep covers a failed enqueue"""
+    try:
+        task.apply_async(args=args, eta=eta)
+    except Exception as e:
+        logger.error(f"Error scheduling {task.name} for {args}: {str(e)}")
+
+
+def schedule_swapanza_expiry(chat_id, ends_at):
+    """Expire the chat's Swapanza exactly at ``ends_at``, once the activation commits"""
+    transaction.on_commit(lambda: _schedule(
+        expire_swapanza, [chat_id, ends_at.isoformat()], ends_at))
+
+
+def schedule_stale_invite_cleanup(chat_id, requested_at):
+    """Withdraw the chat's pending invite if it is still pending after STALE_INVITE_TIMEOUT"""
+    transaction.on_commit(lambda: _schedule(
+        expire_stale_swapanza_invite, [chat_id, requested_at.isoformat()],
+        requested_at + STALE_INVITE_TIMEOUT))
+
+
+async def _send_all(channel_layer, messages):
+    """Send every ``(group, event)`` concurrently, logging failures individually"""
+    results = await asyncio.gather(
+        *(channel_layer.group_send(group, event) for group, event in messages),
+        return_exceptions=True)
+    for (group, event), result in zip(messages, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error sending {event['type']} to {group}: {str(result)}")
+
+
+def expiry_messages(pairs, user_ids=()):
+    """Channel messages telling the affected chats and users their Swapanza is over.
+
+    ``pairs`` are the exact ``(user_id, chat_id)`` combinations that expired:
+    each chat gets one expire event and one logout, which closes every socket
+    in the chat, and each user one logout on their personal channel.
+    ``user_ids`` adds users whose session had no chat.
+    """
+    chat_ids = {chat_id for _, chat_id in pairs}
+    user_ids = {user_id for user_id, _ in pairs} | set(user_ids)
+
+    messages = [(f'chat_{chat_id}', {'type': 'swapanza_expire'})
+                for chat_id in chat_ids]
+    messages += [(f'user_{user_id}', {
+        'type': 'swapanza_logout',
+        'force_redirect': True
+    }) for user_id in user_ids]
+    messages += [(f'chat_{chat_id}', {
+        'type': 'swapanza_logout',
+        'force_redirect': True
+    }) for chat_id in chat_ids]
+    return messages
+
+
+def _participant_pairs(chat_ids):
+    """``(user_id, chat_id)`` for every participant of the given chats"""
+    return Chat.participants.through.objects.filter(
+        chat_id__in=chat_ids).values_list('user_id', 'chat_id')
+
+
+@shared_task
+def expire_swapanza(chat_id, ends_at):
+    """Expire one chat's Swapanza at the end time it was scheduled for.
+
+    Safe to run more than once or late: only the Swapanza that still has this
+    ``ends_at`` is touched, so a newer Swapanza in the same chat is left alone.
+    """
+    ends_at = parse_datetime(ends_at)
+
+    session_count = SwapanzaSession.objects.filter(
+        chat_id=chat_id, active=True, ends_at=ends_at).update(active=False)
+
+    chat_count = Chat.end_swapanza(id=chat_id,
+                                   swapanza_active=True,
+                                   swapanza_ends_at=ends_at)
+
+    if not session_count and not chat_count:
+        return f"Swapanza in chat {chat_id} already expired"
+
+    pairs = list(_participant_pairs([chat_id]))
+    logger.info(f"[Swapanza Expiry] Expired Swapanza in chat {chat_id} ({session_count} sessions)")
+
+    async_to_sync(_send_all)(get_channel_layer(), expiry_messages(pairs))
+    publish_swapanza_state({user_id for user_id, _ in pairs})
+    return f"Expired Swapanza in chat {chat_id}. Affected {len(pairs)} users."
+
+
+@shared_task
+def expire_stale_swapanza_invite(chat_id, requested_at):
+    """Withdraw a pending invite that is still the one scheduled and was never activated"""
+    cleared = Chat.objects.filter(
+        id=chat_id,
+        swapanza_requested_at=parse_datetime(requested_at),
+        swapanza_active=False).update(swapanza_requested_by=None,
+                                      swapanza_requested_at=None,
+                                      swapanza_duration=None)
+    if not cleared:
+        return f"Invite in chat {chat_id} already handled"
+
+    logger.info(f"[Stale Cleanup] Cleared stale invite in chat {chat_id}")
+    async_to_sync(get_channel_layer().group_send)(
+        f'chat_{chat_id}',
+        {
+            'type': 'swapanza_cancel',
+            'cancelled_by': None,  # System cleanup
+            'cancelled_by_username': 'System',
+        }
+    )
+    return f"Cleared stale invite in chat {chat_id}"
+
 @shared_task
 def check_expired_swapanzas():
-    """Check for expired Swapanzas and clean up stale invitations"""
+    """Safety net for expiries whose scheduled task was lost (e.g. broker restart)"""
     now = timezone.now()
     channel_layer = get_channel_layer()
-    
-    # Find all expired Swapanza sessions
-    expired_sessions = SwapanzaSession.objects.filter(
-        active=True,
-        ends_at__lte=now
-    )
-    
-    # Track affected users and chats
-    affected_users = set()
-    affected_chats = set()
-    session_count = 0
-    
-    # Deactivate all expired sessions
-    for session in expired_sessions:
-        try:
-            # Mark the session as inactive
-            session.active = False
-            session.save(update_fields=['active'])
-            
-            # Track affected users and chats
-            affected_users.add(session.user.id)
-            if session.chat:
-                affected_chats.add(session.chat.id)
-            
-            # Log for debugging
-            logger.info(f"[Swapanza Expiry] Deactivated session for user {session.user.username} in chat {session.chat_id if session.chat else 'None'}")
-            session_count += 1
-        except Exception as e:
-            logger.error(f"Error deactivating session: {str(e)}")
-    
-    # Handle chat-specific Swapanza 
-    expired_chats = Chat.objects.filter(
-        swapanza_active=True,
-        swapanza_ends_at__lte=now
-    )
-    
-    chat_count = 0
-    for chat in expired_chats:
-        try:
-            # Reset chat Swapanza state
-            chat.swapanza_active = False
-            chat.save(update_fields=['swapanza_active'])
-            
-            # Add to affected chats
-            affected_chats.add(chat.id)
-            
-            # Add all participants to affected users
-            for user_id in chat.participants.values_list('id', flat=True):
-                affected_users.add(user_id)
-            
-            logger.info(f"[Swapanza Expiry] Deactivated Swapanza in chat {chat.id}")
-            chat_count += 1
-        except Exception as e:
-            logger.error(f"Error deactivating chat Swapanza: {str(e)}")
-    
-    # NEW: Clean up stale pending invitations (older than 10 minutes)
-    stale_threshold = now - timezone.timedelta(minutes=10)
-    stale_invites = Chat.objects.filter(
-        swapanza_requested_by__isnull=False,
-        swapanza_requested_at__lt=stale_threshold,
-        swapanza_active=False
-    )
-    
-    stale_count = 0
-    for chat in stale_invites:
-        try:
-            logger.info(f"[Stale Cleanup] Clearing stale invite in chat {chat.id} from {chat.swapanza_requested_by.username}")
-            chat.swapanza_requested_by = None
-            chat.swapanza_requested_at = None
-            chat.swapanza_confirmed_users = []
-            chat.swapanza_duration = None
-            chat.save(update_fields=[
-                'swapanza_requested_by', 'swapanza_requested_at', 
-                'swapanza_confirmed_users', 'swapanza_duration'
-            ])
-            stale_count += 1
-            
-            # Notify chat participants that stale invite was cleaned up
-            async_to_sync(channel_layer.group_send)(
-                f'chat_{chat.id}',
-                {
-                    'type': 'swapanza_cancel',
-                    'cancelled_by': None,  # System cleanup
-                    'cancelled_by_username': 'System',
-                }
-            )
-            
-        except Exception as e:
-            logger.error(f"Error clearing stale invite: {str(e)}")
-    
-    # Send notifications to all affected chats - this notifies users in the chat
-    for chat_id in affected_chats:
-        try:
-            async_to_sync(channel_layer.group_send)(
-                f'chat_{chat_id}',
-                {
-                    'type': 'swapanza_expire',
-                }
-            )
-            logger.info(f"[Swapanza Expiry] Sent expire notification to chat {chat_id}")
-        except Exception as e:
-            logger.error(f"Error sending expire notification to chat {chat_id}: {str(e)}")
-    
-    # Send logout notifications to all affected users - CRITICAL: This must be sent to user's personal channels
-    for user_id in affected_users:
-        try:
-            # First to user's personal channel
-            user_channel = f'user_{user_id}'
-            async_to_sync(channel_layer.group_send)(
-                user_channel,
-                {
-                    'type': 'swapanza_logout',
-                    'force_redirect': True
-                }
-            )
-            
-            # Also to any chat the user might be in
-            for chat_id in affected_chats:
-                async_to_sync(channel_layer.group_send)(
-                    f'chat_{chat_id}',
-                    {
-                        'type': 'swapanza_logout',
-                        'force_redirect': True,
-                        'user_id': user_id
-                    }
-                )
-            
-            logger.info(f"[Swapanza Expiry] Sent logout notification to user {user_id}")
-        except Exception as e:
-            logger.error(f"Error sending logout notification to user {user_id}: {str(e)}")
-    
+
+    with transaction.atomic():
+        # Expired sessions: read the affected (user, chat) pairs, then flip them in one UPDATE
+        expired_sessions = list(
+            SwapanzaSession.objects.select_for_update(skip_locked=True).filter(
+                active=True, ends_at__lte=now).values_list('id', 'user_id', 'chat_id'))
+        session_count = SwapanzaSession.objects.filter(
+            id__in=[session_id for session_id, _, _ in expired_sessions]).update(active=False)
+
+        # Chat-level Swapanza state
+        expired_chat_ids = list(
+            Chat.objects.select_for_update(skip_locked=True).filter(
+                swapanza_active=True, swapanza_ends_at__lte=now).values_list('id', flat=True))
+        chat_count = Chat.end_swapanza(id__in=expired_chat_ids)
+
+        # Stale pending invitations
+        stale_chat_ids = list(
+            Chat.objects.select_for_update(skip_locked=True).filter(
+                swapanza_requested_by__isnull=False,
+                swapanza_requested_at__lt=now - STALE_INVITE_TIMEOUT,
+                swapanza_active=False).values_list('id', flat=True))
+        stale_count = Chat.objects.filter(id__in=stale_chat_ids).update(
+            swapanza_requested_by=None,
+            swapanza_requested_at=None,
+            swapanza_duration=None)
+
+        pairs = {(user_id, chat_id)
+                 for _, user_id, chat_id in expired_sessions if chat_id}
+        pairs.update(_participant_pairs(expired_chat_ids))
+        publish_swapanza_state({user_id for user_id, _ in pairs} |
+                               {user_id for _, user_id, _ in expired_sessions})
+
+    if expired_sessions or expired_chat_ids:
+        logger.info(f"[Swapanza Expiry] Deactivated {session_count} sessions and {chat_count} chats")
+    if stale_chat_ids:
+        logger.info(f"[Stale Cleanup] Cleared stale invites in chats {stale_chat_ids}")
+
+    # Sessions without a chat only need the personal logout
+    orphan_users = {user_id for _, user_id, chat_id in expired_sessions if not chat_id}
+    messages = expiry_messages(pairs, orphan_users)
+    messages += [(f'chat_{chat_id}', {
+        'type': 'swapanza_cancel',
+        'cancelled_by': None,  # System cleanup
+        'cancelled_by_username': 'System',
+    }) for chat_id in stale_chat_ids]
+    if messages:
+        async_to_sync(_send_all)(channel_layer, messages)
+
+    affected_users = {user_id for user_id, _ in pairs} | orphan_users
     return f"Reset {session_count} expired sessions, {chat_count} chat Swapanzas, and {stale_count} stale invites. Affected {len(affected_users)} users."
 
+
+def clear_unread(user_id, cleared=0, progress=None):
+    """Clear every unread counter of the user, one bounded transaction per chunk.
+
+    ``cleared`` is what earlier chunks already cleared; ``progress(total)`` is
+    called after each full chunk. Returns the total.
+    """
+    chunk_size = getattr(settings, 'NOTIFICATION_RESET_CHUNK_SIZE', 500)
+    while True:
+        chunk_cleared, counters = ChatMembership.mark_read_chunk(user_id, chunk_size)
+        cleared += chunk_cleared
+        if counters < chunk_size:
+            return cleared
+        if progress:
+            progress(cleared)
+
+
+@shared_task
+def reset_user_notifications(user_id, cleared=0):
+    """Finish a reset the request handed off after its first chunk"""
+    cleared = clear_unread(user_id, cleared,
+                           progress=lambda total: publish_reset_progress(user_id, total))
+    publish_unread_cleared(user_id)
+    publish_reset_progress(user_id, cleared, done=True)
+    return f"Reset {cleared} notifications of user {user_id}"
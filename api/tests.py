@@ -1,3 +1,210 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import Chat, Message, User
+from .routing import websocket_urlpatterns
+from .user_cache import InMemoryUserCache
+from . import user_cache, user_search
+from .user_search import SearchCache, cached_search_users, search_users
+
+
+def communicator(user, path):
+    """A WebSocket client for ``path`` already authenticated as ``user``"""
+    client = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+    client.scope['user'] = user
+    return client
+
+
+async def receive_frame(client, frame_type):
+    """The next frame of ``frame_type``, skipping any other"""
+    while True:
+        frame = json.loads(await client.receive_from())
+        if frame['type'] == frame_type:
+            return frame
+
+
+class ChatAccessTests(TransactionTestCase):
+    """Chat history and live frames reach only the chat's participants"""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'password')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'password')
+        self.eve = User.objects.create_user('eve', 'eve@example.com', 'password')
+        self.chat, _ = Chat.get_or_create_direct(self.alice.id, self.bob.id)
+        Message.objects.create(chat=self.chat, sender=self.alice, content='secret')
+
+    def test_non_participant_cannot_connect(self):
+        async def run():
+            client = communicator(self.eve, f'/ws/chat/{self.chat.id}/?last_seq=0')
+            connected, code = await client.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4003)
+        async_to_sync(run)()
+
+    def test_unknown_chat_is_refused(self):
+        async def run():
+            client = communicator(self.eve, '/ws/chat/9999/')
+            connected, code = await client.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4004)
+        async_to_sync(run)()
+
+    def test_removed_participant_cannot_replay(self):
+        async def run():
+            client = communicator(self.bob, f'/ws/chat/{self.chat.id}/')
+            connected, _ = await client.connect()
+            self.assertTrue(connected)
+            await receive_frame(client, 'init')
+
+            await self.remove_participant(self.bob)
+            await client.send_to(text_data=json.dumps({'type': 'chat.replay', 'after_seq': 0}))
+            output = await client.receive_output()
+            while output['type'] == 'websocket.send':
+                self.assertNotIn('secret', output.get('text') or '')
+                output = await client.receive_output()
+            self.assertEqual(output, {'type': 'websocket.close', 'code': 4003})
+        async_to_sync(run)()
+
+    def test_participant_can_replay(self):
+        async def run():
+            client = communicator(self.bob, f'/ws/chat/{self.chat.id}/')
+            connected, _ = await client.connect()
+            self.assertTrue(connected)
+            await receive_frame(client, 'init')
+
+            await client.send_to(text_data=json.dumps({'type': 'chat.replay', 'after_seq': 0}))
+            replay = await receive_frame(client, 'chat.replay')
+            self.assertEqual([m['content'] for m in replay['messages']], ['secret'])
+            await client.disconnect()
+        async_to_sync(run)()
+
+    async def remove_participant(self, user):
+        await database_sync_to_async(self.chat.participants.remove)(user)
+
+    def test_non_participant_cannot_subscribe(self):
+        async def run():
+            client = communicator(self.eve, '/ws/user/')
+            connected, _ = await client.connect()
+            self.assertTrue(connected)
+
+            await client.send_to(text_data=json.dumps({
+                'type': 'subscribe', 'chat_id': self.chat.id, 'last_seq': 0}))
+            closed = await receive_frame(client, 'chat.closed')
+            self.assertEqual(closed, {'type': 'chat.closed', 'chat_id': self.chat.id,
+                                      'code': 4003, 'reason': 'forbidden'})
+
+            await client.send_to(text_data=json.dumps({
+                'type': 'chat.replay', 'chat_id': self.chat.id, 'after_seq': 0}))
+            error = await receive_frame(client, 'error')
+            self.assertEqual(error['message'], f'Not subscribed to chat {self.chat.id}')
+            await client.disconnect()
+        async_to_sync(run)()
+
+    def test_participant_can_subscribe(self):
+        async def run():
+            client = communicator(self.bob, '/ws/user/')
+            connected, _ = await client.connect()
+            self.assertTrue(connected)
+
+            await client.send_to(text_data=json.dumps({'type': 'subscribe', 'chat_id': self.chat.id}))
+            frame = await receive_frame(client, 'chat.frame')
+            self.assertEqual(frame['frame']['type'], 'init')
+            await client.disconnect()
+        async_to_sync(run)()
+
+
+class UserSearchTests(TestCase):
+    """Username search ranks, pages and caches without losing matches"""
+
+    def setUp(self):
+        for username in ['bob', 'bobby', 'alice', 'rob', 'obi']:
+            User.objects.create_user(username, f'{username}@example.com', 'password')
+
+    def names(self, query, limit=10, cursor=None, exclude_id=None):
+        rows, next_cursor = search_users(query, limit, cursor, exclude_id)
+        return [row['username'] for row in rows], next_cursor
+
+    def test_short_query_matches_substrings(self):
+        self.assertEqual(self.names('ob')[0], ['obi', 'bob', 'bobby', 'rob'])
+
+    def test_short_query_stops_after_one_page_of_substrings(self):
+        names, cursor = self.names('ob', limit=2)
+        self.assertEqual(names, ['obi', 'bob'])
+        self.assertIsNone(cursor)
+
+    def test_long_query_pages_through_substrings(self):
+        names, cursor = self.names('bob', limit=1)
+        pages = [names]
+        while cursor:
+            names, cursor = self.names('bob', limit=1, cursor=cursor)
+            pages.append(names)
+        self.assertEqual(pages, [['bob'], ['bobby']])
+
+    def test_excluded_user_does_not_shorten_the_page(self):
+        bob = User.objects.get(username='bob')
+        names, cursor = self.names('bob', limit=1, exclude_id=bob.id)
+        self.assertEqual(names, ['bobby'])
+        self.assertIsNone(cursor)
+
+    def test_saving_a_user_drops_only_pages_showing_them(self):
+        with mock.patch.object(user_search, 'search_cache', SearchCache()):
+            cached_search_users('ali', 10)
+            cached_search_users('rob', 10)
+            User.objects.get(username='rob').save()
+            self.assertIsNotNone(user_search.search_cache.get(('ALI', 10, None, None)))
+            self.assertIsNone(user_search.search_cache.get(('ROB', 10, None, None)))
+
+
+class CachedUserQueryTests(TestCase):
+    """Views read the requesting user's fields from the user cache, not the database"""
+
+    def setUp(self):
+        patcher = mock.patch.object(user_cache, '_cache', InMemoryUserCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'password', bio='hi')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.alice)}')
+
+    def add_chats(self, count):
+        for _ in range(count):
+            other = User.objects.create_user(f'user{User.objects.count()}',
+                                             f'user{User.objects.count()}@example.com', 'password')
+            chat, _ = Chat.get_or_create_direct(self.alice.id, other.id)
+            Message.objects.create(chat=chat, sender=other, content='hello')
+
+    def get(self, path, queries):
+        self.client.get(path)  # fills the user cache
+        with self.assertNumQueries(queries):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_profile(self):
+        response = self.get('/api/profile/', 0)
+        self.assertEqual(response.data['email'], 'alice@example.com')
+        self.assertEqual(response.data['bio'], 'hi')
+
+    def test_chat_list(self):
+        # The chats with their memberships, participants, Swapanza
+        # participants and last messages, however many chats there are
+        self.add_chats(1)
+        self.get('/api/chats/', 4)
+        self.add_chats(3)
+        response = self.get('/api/chats/', 4)
+        self.assertEqual(len(response.data), 4)
+
+    def test_bootstrap(self):
+        # The chat list's four, then the user's Swapanza session
+        self.add_chats(2)
+        response = self.get('/api/bootstrap/', 5)
+        self.assertEqual(response.data['profile']['email'], 'alice@example.com')
+        self.assertEqual(len(response.data['chats']), 2)
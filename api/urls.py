@@ -14,6 +14,7 @@ urlpatterns = [
     path('profile/<int:user_id>/upload-image/', views.upload_profile_image, name='upload-profile-image'),
 
     path('users/', views.UserListView.as_view(), name='user-list'),
+    path('bootstrap/', views.bootstrap, name='bootstrap'),
     path('unread-counts/', views.unread_message_counts, name='unread-counts'),
     path('reset-notifications/', views.reset_notifications, name='reset-notifications'),
     path('chats/find-by-user/<int:user_id>/', views.find_chat_by_user, name='find-chat-by-user'),
@@ -0,0 +1,157 @@
+"""Short-lived cache of authenticated users, shared by HTTP and WebSocket auth.
+
+Every authenticated request and socket handshake resolves its JWT to a User.
+The token itself is checked every time; only the row lookup is cached, keyed
+by user id, for at most ``USER_CACHE_TTL`` seconds and never past the expiry
+of the token that filled it. Saving or deleting a user drops its entry (see
+``ChatConfig.ready``), so profile edits are visible on the next request.
+
+Only the fields in ``CACHED_FIELDS`` are cached, as JSON: those the views
+serialize for the requesting user. A hit rebuilds the User with the rest
+(``password``, ``last_login``, ``is_superuser``, ``date_joined`` and
+``profile_image_public_id``) deferred, so reading one costs a query and
+``save()`` writes only the fields that were loaded or set. The password
+hash never leaves the database.
+
+Redis (``REDIS_URL``) is used when configured; otherwise an in-process cache
+is used. That one is only invalidated in the process that saved the user,
+so a deployment running more than one process needs Redis, or another
+process keeps serving the old user for up to ``USER_CACHE_TTL`` seconds.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router
+from rest_framework_simplejwt.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_TTL = 60
+
+CACHED_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'bio',
+                 'is_active', 'is_staff', 'profile_image_url')
+
+
+def user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def dump_user(user):
+    return json.dumps({field: getattr(user, field) for field in CACHED_FIELDS})
+
+
+def load_user(data):
+    """A User of the cached fields, with the rest deferred"""
+    values = json.loads(data)
+    User = get_user_model()
+    # from_db takes the values in model field order
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(router.db_for_read(User), fields, [values[field] for field in fields])
+
+
+class RedisUserCache:
+    """Users as JSON under per-user keys that expire on their own"""
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+
+    def get(self, user_id):
+        data = self.redis.get(user_key(user_id))
+        return load_user(data) if data is not None else None
+
+    def set(self, user_id, user, ttl):
+        self.redis.set(user_key(user_id), dump_user(user), ex=ttl)
+
+    def delete(self, user_id):
+        self.redis.delete(user_key(user_id))
+
+
+class InMemoryUserCache:
+    """Process-local fallback with the same interface as RedisUserCache.
+
+    Users are kept as JSON too, so concurrent requests never share an instance.
+    """
+
+    max_users = 10000
+
+    def __init__(self):
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            return load_user(entry[0])
+
+    def set(self, user_id, user, ttl):
+        with self._lock:
+            self._users[user_id] = (dump_user(user), time.time() + ttl)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+_cache = None
+
+
+def get_user_cache():
+    """Return the process-wide user cache, Redis-backed when REDIS_URL is set"""
+    global _cache
+    if _cache is None:
+        redis_url = getattr(settings, 'REDIS_URL', None)
+        _cache = RedisUserCache(redis_url) if redis_url else InMemoryUserCache()
+    return _cache
+
+
+def get_cached_user(validated_token, load):
+    """The token's user from the cache, or from ``load()`` (which may raise) on a miss"""
+    user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return load()
+
+    cache = get_user_cache()
+    try:
+        user = cache.get(user_id)
+    except Exception as e:
+        logger.warning(f"Could not read cached user {user_id}: {e}")
+        return load()
+    if user is not None:
+        return user
+
+    user = load()
+    ttl = min(USER_CACHE_TTL, int(validated_token.get('exp', 0) - time.time()))
+    if ttl > 0:
+        try:
+            cache.set(user_id, user, ttl)
+        except Exception as e:
+            logger.warning(f"Could not cache user {user_id}: {e}")
+    return user
+
+
+def invalidate_user(user_id):
+    """Drop a user's cached row after it changed"""
+    try:
+        get_user_cache().delete(user_id)
+    except Exception as e:
+        logger.warning(f"Could not invalidate cached user {user_id}: {e}")
+
+
+def invalidate_saved_user(sender, instance, **kwargs):
+    """post_save/post_delete receiver for the user model"""
+    invalidate_user(instance.pk)
@@ -0,0 +1,170 @@
+"""Username search ranked exact, then prefix, then substring, with keyset paging.
+
+Each rank is its own query over an index on PostgreSQL (see migration 0027):
+
+- exact and prefix matches read the ``UPPER(username) COLLATE "C"`` btree in
+  order, so they stop after one page whatever the size of the user table,
+- substring matches use the pg_trgm GIN index on ``UPPER(username)``.
+  Trigrams can't narrow the scan for queries shorter than
+  ``MIN_SUBSTRING_LENGTH`` characters, so their substring matches are cut
+  at the end of the page they start on ("ob" still finds "bob", but a
+  short query never pages through substring matches).
+
+Within a rank users are ordered by upper-cased username, then id; a cursor is
+the ``(rank, key, id)`` of the last user returned. Other databases (SQLite in
+tests) run the same queries without the indexes.
+
+Result pages are kept for ``CACHE_TTL`` seconds in a process-local LRU, so
+the debounced keystrokes of a user typing and paging hit the database once.
+Saving or deleting a user drops the pages that show that user, in this
+process only (see ``ChatConfig.ready``). New matches, and pages cached by
+other processes, catch up when their entry expires.
+"""
+import base64
+import binascii
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast, Collate, Upper
+
+MIN_SUBSTRING_LENGTH = 3
+MAX_QUERY_LENGTH = 150
+CACHE_TTL = 30
+
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(rank, key, user_id):
+    return base64.urlsafe_b64encode(json.dumps([rank, key, user_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        rank, key, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursor(cursor)
+    if rank not in (EXACT, PREFIX, SUBSTRING) or not isinstance(key, str) or not isinstance(user_id, int):
+        raise InvalidCursor(cursor)
+    return rank, key, user_id
+
+
+def search_key():
+    """Upper-cased username in byte order, matching the index on PostgreSQL"""
+    key = Upper(Cast('username', TextField()))
+    if connection.vendor == 'postgresql':
+        return Collate(key, 'C')
+    if connection.vendor == 'sqlite':
+        return Collate(key, 'BINARY')
+    return key
+
+
+def rank_filter(rank, key):
+    if rank == EXACT:
+        return Q(search_key=key)
+    if rank == PREFIX:
+        return Q(search_key__startswith=key) & ~Q(search_key=key)
+    return Q(username__icontains=key) & ~Q(search_key__startswith=key)
+
+
+def search_users(query, limit, cursor=None, exclude_id=None):
+    """One page of users matching ``query``: ``(rows, next_cursor_or_None)``.
+
+    Rows are ``id``/``username``/``profile_image_url`` dicts; the user with
+    ``exclude_id`` is never among them. Raises InvalidCursor for a cursor
+    this module didn't make.
+    """
+    key = query.strip()[:MAX_QUERY_LENGTH].upper()
+    if not key:
+        return [], None
+
+    start_rank, after_key, after_id = decode_cursor(cursor) if cursor else (EXACT, None, None)
+    pages_substrings = len(key) >= MIN_SUBSTRING_LENGTH
+    if start_rank == SUBSTRING and not pages_substrings:
+        return [], None
+
+    users = get_user_model().objects.annotate(search_key=search_key())
+    if exclude_id is not None:
+        users = users.exclude(id=exclude_id)
+    rows = []
+    for rank in range(start_rank, SUBSTRING + 1):
+        matches = users.filter(rank_filter(rank, key))
+        if rank == start_rank and after_key is not None:
+            matches = matches.filter(Q(search_key__gt=after_key) |
+                                     Q(search_key=after_key, id__gt=after_id))
+        wanted = limit + 1 - len(rows)
+        rows += [dict(row, rank=rank) for row in matches.order_by('search_key', 'id').values(
+            'id', 'username', 'profile_image_url', 'search_key')[:wanted]]
+        if len(rows) > limit:
+            break
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if last['rank'] != SUBSTRING or pages_substrings:
+            next_cursor = encode_cursor(last['rank'], last['search_key'], last['id'])
+    return [{'id': row['id'], 'username': row['username'],
+             'profile_image_url': row['profile_image_url']} for row in rows], next_cursor
+
+
+class SearchCache:
+    """LRU of recent result pages, each kept at most ``ttl`` seconds"""
+
+    def __init__(self, max_entries=1000, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._pages[key]
+                return None
+            self._pages.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, page):
+        with self._lock:
+            self._pages[key] = (page, time.monotonic() + self.ttl)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def discard_user(self, user_id):
+        """Drop every page that shows the user"""
+        with self._lock:
+            stale = [key for key, ((rows, _), _) in self._pages.items()
+                     if any(row['id'] == user_id for row in rows)]
+            for key in stale:
+                del self._pages[key]
+
+
+search_cache = SearchCache()
+
+
+def cached_search_users(query, limit, cursor=None, exclude_id=None):
+    """search_users through the process-wide result cache"""
+    cache_key = (query.strip()[:MAX_QUERY_LENGTH].upper(), limit, cursor, exclude_id)
+    page = search_cache.get(cache_key)
+    if page is None:
+        page = search_users(query, limit, cursor, exclude_id)
+        search_cache.set(cache_key, page)
+    return page
+
+
+def discard_saved_user(sender, instance, **kwargs):
+    """post_save/post_delete receiver for the user model"""
+    search_cache.discard_user(instance.pk)
@@ -0,0 +1,274 @@
+"""Versioned unread and Swapanza state, pushed to each user's notification socket.
+
+Every change to a user's unread counters or Swapanza state increments their
+state version, and the new state goes to their ``user_{id}`` group as a
+``notify`` frame carrying that ``version``:
+
+- ``unread_count``: one chat's counter (``chat_id``, ``count``),
+- ``unread_counts``: every non-zero counter (``counts``), after a bulk reset,
+- ``swapanza.state``: what ``/api/active-swapanza/`` reports (``swapanza``).
+
+A reset of every counter that runs in the background also sends unversioned
+``notifications.reset`` frames with the number of messages ``cleared`` so
+far, the last one with ``done`` set after the final ``unread_counts``.
+
+A client that saw every version is current and doesn't poll. One that missed
+some (a reconnect, a jump in ``version``) asks ``/api/unread-counts/`` and
+``/api/active-swapanza/`` with ``?since_version=N``; both answer 304 without
+touching the database while the version is still N, and otherwise send the
+state with its version in the ``X-State-Version`` header.
+
+Versions live in Redis (``REDIS_URL``) when configured so every worker
+shares them; otherwise an in-process counter is used, which is only correct
+with a single process.
+
+The ``publish_*`` helpers send once the current transaction commits. Model
+methods never call them; the code that changed the state does. Consumers
+wrap their database calls in ``collect_state`` and send what was collected
+with ``send_state_async`` from the event loop, so the thread that runs every
+consumer's database work never waits on Redis or the channel layer.
+"""
+import asyncio
+import contextlib
+import contextvars
+import logging
+import threading
+
+import redis
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChatMembership, Message, SwapanzaSession
+from .swapanza_state import SWAPANZA_MESSAGE_LIMIT, get_swapanza_store
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION_HEADER = 'X-State-Version'
+
+
+def version_key(user_id):
+    return f'user:{user_id}:state_version'
+
+
+class RedisStateVersions:
+    """One INCR counter per user"""
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url)
+
+    def get(self, user_id):
+        version = self.redis.get(version_key(user_id))
+        return int(version) if version is not None else 0
+
+    def bump(self, user_ids):
+        pipe = self.redis.pipeline()
+        for user_id in user_ids:
+            pipe.incr(version_key(user_id))
+        return dict(zip(user_ids, pipe.execute()))
+
+
+class InMemoryStateVersions:
+    """Process-local fallback with the same interface as RedisStateVersions"""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            return self._versions.get(user_id, 0)
+
+    def bump(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            return {user_id: self._versions[user_id] for user_id in user_ids}
+
+
+_versions = None
+
+
+def get_state_versions():
+    """Return the process-wide version store, Redis-backed when REDIS_URL is set"""
+    global _versions
+    if _versions is None:
+        redis_url = getattr(settings, 'REDIS_URL', None)
+        _versions = RedisStateVersions(redis_url) if redis_url else InMemoryStateVersions()
+    return _versions
+
+
+def current_version(user_id):
+    """The user's state version, or None when the store can't be read"""
+    try:
+        return get_state_versions().get(user_id)
+    except Exception as e:
+        logger.warning(f"Could not read state version of user {user_id}: {e}")
+        return None
+
+
+def swapanza_state(user_id, chat_id=None, now=None):
+    """The user's running Swapanza as reported by ``/api/active-swapanza/``.
+
+    ``chat_specific_count`` is the user's message count in ``chat_id``, or 0.
+    """
+    now = now or timezone.now()
+    session = SwapanzaSession.objects.filter(
+        user_id=user_id, active=True, ends_at__gt=now).select_related('partner').first()
+    if not session:
+        return {'active': False}
+
+    # Counts come from the Swapanza store; the database is only read to seed it
+    store = get_swapanza_store()
+    sent = Message.objects.filter(sender_id=user_id,
+                                  during_swapanza=True,
+                                  created_at__gte=session.started_at)
+
+    chat_specific_count = 0
+    if chat_id:
+        try:
+            chat_specific_count = store.get_chat_count(
+                session.id, int(chat_id), session.ends_at,
+                seed=lambda: sent.filter(chat_id=chat_id).count())
+        except ValueError:
+            pass
+
+    total_message_count = store.get_total_count(session.id, session.ends_at, seed=sent.count)
+
+    partner = session.partner
+    return {
+        'active': True,
+        'partner_id': partner.id,
+        'partner_username': partner.username,
+        'partner_profile_image': getattr(partner, 'profile_image_url', None),
+        'ends_at': session.ends_at.isoformat(),
+        'started_at': session.started_at.isoformat(),
+        'message_count': total_message_count,
+        'chat_specific_count': chat_specific_count,
+        'remaining_messages': max(0, SWAPANZA_MESSAGE_LIMIT - total_message_count),
+        'chat_id': session.chat_id,
+        'server_time': now.isoformat(),
+    }
+
+
+async def _send_notifications(frames):
+    channel_layer = get_channel_layer()
+    results = await asyncio.gather(
+        *(channel_layer.group_send(f'user_{user_id}', {'type': 'notify', 'data': data})
+          for user_id, data in frames),
+        return_exceptions=True)
+    for (user_id, data), result in zip(frames, results):
+        if isinstance(result, Exception):
+            logger.error(f"Error sending {data['type']} to user {user_id}: {result}")
+
+
+def _bump_versions(frames):
+    """Bump the version of each frame's user and stamp it on the frame"""
+    try:
+        versions = get_state_versions().bump([user_id for user_id, _ in frames])
+    except Exception as e:
+        logger.warning(f"Could not bump state versions: {e}")
+        versions = {}
+    for user_id, data in frames:
+        if user_id in versions:
+            data['version'] = versions[user_id]
+
+
+def send_state(frames):
+    """Bump each user's version, stamp it on their frame and send every ``(user_id, frame)``"""
+    if not frames:
+        return
+    _bump_versions(frames)
+    async_to_sync(_send_notifications)(frames)
+
+
+async def send_state_async(frames):
+    """send_state for the event loop; the version store is called from a worker thread"""
+    if not frames:
+        return
+    await sync_to_async(_bump_versions, thread_sensitive=False)(frames)
+    await _send_notifications(frames)
+
+
+_collected = contextvars.ContextVar('collected_state_frames', default=None)
+
+
+@contextlib.contextmanager
+def collect_state():
+    """Keep the frames published inside the block, for ``send_state_async``, instead of sending.
+
+    The list is shared with the database_sync_to_async calls made in the
+    block, which run in a copy of the caller's context.
+    """
+    frames = []
+    token = _collected.set(frames)
+    try:
+        yield frames
+    finally:
+        _collected.reset(token)
+
+
+def _on_commit(build):
+    """Build the frames once the current transaction commits, then send or collect them"""
+    def publish():
+        try:
+            frames = build()
+            collected = _collected.get()
+            if collected is not None:
+                collected.extend(frames)
+            else:
+                send_state(frames)
+        except Exception as e:
+            logger.error(f"Error publishing user state: {e}")
+    transaction.on_commit(publish)
+
+
+def publish_unread_counts(chat_id, exclude_user_id=None):
+    """Push their counter for ``chat_id`` to every member but ``exclude_user_id``"""
+    def build():
+        counts = ChatMembership.objects.filter(chat_id=chat_id).exclude(
+            user_id=exclude_user_id).values_list('user_id', 'unread_count')
+        return [(user_id, {'type': 'unread_count', 'chat_id': chat_id, 'count': count})
+                for user_id, count in counts]
+    _on_commit(build)
+
+
+def publish_unread_cleared(user_id, chat_id=None):
+    """Push a reset of the user's counter for ``chat_id``, or of all their counters"""
+    def build():
+        if chat_id is not None:
+            return [(user_id, {'type': 'unread_count', 'chat_id': int(chat_id), 'count': 0})]
+        counts = ChatMembership.objects.filter(
+            user_id=user_id, unread_count__gt=0).values_list('chat_id', 'unread_count')
+        return [(user_id, {'type': 'unread_counts',
+                           'counts': {str(chat): count for chat, count in counts}})]
+    _on_commit(build)
+
+
+def publish_swapanza_state(user_ids):
+    """Push the current Swapanza state of each user.
+
+    Pushes aren't scoped to a chat, so they leave out ``chat_specific_count``.
+    """
+    user_ids = list(user_ids)
+
+    def build():
+        now = timezone.now()
+        frames = []
+        for user_id in user_ids:
+            state = swapanza_state(user_id, now=now)
+            state.pop('chat_specific_count', None)
+            frames.append((user_id, {'type': 'swapanza.state', 'swapanza': state}))
+        return frames
+    _on_commit(build)
+
+
+def publish_reset_progress(user_id, cleared, done=False):
+    """Tell the user how far a background reset of their counters got"""
+    try:
+        async_to_sync(_send_notifications)(
+            [(user_id, {'type': 'notifications.reset', 'cleared': cleared, 'done': done})])
+    except Exception as e:
+        logger.error(f"Error publishing reset progress: {e}")
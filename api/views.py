@@ -1,21 +1,28 @@
 import logging
 import os
-from django.db.models import Q, Count, Prefetch
+from django.db.models import Q, Count, F, OuterRef, Prefetch, Subquery
 from django.utils import timezone
 from rest_framework import generics, permissions, status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ParseError, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.views.decorators.csrf import csrf_exempt
 import cloudinary.uploader
 from backend import settings
-from .models import Chat, Message, SwapanzaSession
+from .models import Chat, ChatMembership, Message, SwapanzaSession
+from .consumers import broadcast_chat_invalidate
+from .message_buffer import buffer_message, get_recent_messages, refill_buffer
+from .user_search import InvalidCursor, cached_search_users
+from .tasks import clear_unread, reset_user_notifications
+from .user_state import (STATE_VERSION_HEADER, current_version, publish_swapanza_state,
+                         publish_unread_cleared, publish_unread_counts, swapanza_state)
 from .serializers import ChatSerializer, ChatSerializerLight, MessageSerializer, UserSerializer
 from django.contrib.auth import get_user_model
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404, render
 from rest_framework import filters, pagination
+from rest_framework.utils.urls import replace_query_param
 from django.core.exceptions import ValidationError
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
@@ -75,6 +82,17 @@ def upload_profile_image(request, user_id):
         return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def profile_data(user, viewer):
+    """Public profile fields; the email only for the user themselves"""
+    return {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email if user == viewer else None,
+        "profile_image_url": user.profile_image_url,
+        "bio": getattr(user, 'bio', ''),
+    }
+
+
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
 def user_profile(request, user_id=None):
@@ -92,13 +110,7 @@ def user_profile(request, user_id=None):
                         status=status.HTTP_403_FORBIDDEN)
 
     if request.method == 'GET':
-        return Response({
-            "id": user.id,
-            "username": user.username,
-            "email": user.email if user == request.user else None,
-            "profile_image_url": user.profile_image_url,
-            "bio": getattr(user, 'bio', ''),
-        })
+        return Response(profile_data(user, request.user))
 
     elif request.method == 'PUT':
         if 'bio' in request.data:
@@ -118,22 +130,17 @@ def user_profile(request, user_id=None):
 @permission_classes([IsAuthenticated])
 def find_chat_by_user(request, user_id):
     """
-    Find an existing chat between the current user and the specified user
-    """
-    try:
-        
-        other_user = get_object_or_404(User, id=user_id)
-        chat = Chat.objects.filter(participants=request.user).filter(
-            participants=other_user).first()
+    Find the direct chat between the current user and the specified user.
 
-        if chat:
-            serializer = ChatSerializer(chat)
-            return Response(serializer.data)
-        else:
-            return Response({"detail": "Chat not found"},
-                            status=status.HTTP_404_NOT_FOUND)
-    except Exception as e:
-        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    One lookup on the unique ``Chat.direct_key``; the chat comes in the
+    ``/api/chats/`` list shape.
+    """
+    chats = list(user_chats(request.user).filter(
+        direct_key=Chat.direct_key_for(request.user.id, user_id)))
+    if not chats:
+        return Response({"detail": "Chat not found"},
+                        status=status.HTTP_404_NOT_FOUND)
+    return Response(serialize_chat_list(chats, {'request': request})[0])
 
 
 @api_view(['GET', 'POST'])
@@ -154,6 +161,8 @@ def chat_messages(request, chat_id):
         if serializer.is_valid():
 
             message = serializer.save(chat=chat, sender=request.user)
+            buffer_message(message)
+            publish_unread_counts(chat.id, exclude_user_id=request.user.id)
             return Response(MessageSerializer(message).data,
                             status=status.HTTP_201_CREATED)
         else:
@@ -168,20 +177,42 @@ class UserCreate(generics.CreateAPIView):
 
 
 class UserListView(generics.ListAPIView):
-    serializer_class = UserSerializer
+    """Users matching ``?search=``, exact matches first, then prefixes, then substrings.
+
+    Returns a plain list of the first ``page_size`` (default 10) users unless
+    ``cursor`` or ``page_size`` is passed, in which case the results come
+    with a ``next`` link (see user_search). The current user is left out.
+    Queries under three characters page through exact and prefix matches,
+    then end with at most one page of substring matches.
+    """
     permission_classes = [IsAuthenticated]
+    page_size = 10
+    max_page_size = 50
 
-    def get_queryset(self):
-        """Filter users by search query excluding current user"""
-        queryset = User.objects.exclude(id=self.request.user.id)
-        search = self.request.query_params.get('search', None)
+    def list(self, request, *args, **kwargs):
+        search = request.query_params.get('search', '')
+        cursor = request.query_params.get('cursor')
+        paginated = cursor is not None or 'page_size' in request.query_params
+        try:
+            page_size = min(int(request.query_params.get('page_size', self.page_size)),
+                            self.max_page_size)
+        except ValueError:
+            page_size = self.page_size
+        page_size = max(page_size, 1)
 
-        if search:
-            
-            queryset = queryset.filter(username__icontains=search)
+        try:
+            users, next_cursor = cached_search_users(
+                search, page_size, cursor, exclude_id=request.user.id)
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
 
-        
-        return queryset[:10]
+        if not paginated:
+            return Response(users)
+        next_link = None
+        if next_cursor:
+            next_link = replace_query_param(
+                request.build_absolute_uri(), 'cursor', next_cursor)
+        return Response({'next': next_link, 'results': users})
 
 
 @api_view(['GET'])
@@ -191,70 +222,210 @@ def profile(request):
     return Response(serializer.data)
 
 
+class ChatCursorPagination(pagination.CursorPagination):
+    """Keyset pagination over the user's chats, most recently active first.
+
+    Opt-in: responses stay a plain list unless ``cursor`` or ``page_size`` is
+    passed, so existing clients keep working.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-last_activity_at', '-id')
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param not in request.query_params
+                and self.page_size_query_param not in request.query_params):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+def user_chats(user):
+    """The user's chats, most recently active first, annotated from their membership"""
+    return Chat.objects.filter(
+        memberships__user=user
+    ).annotate(
+        unread_count=F('memberships__unread_count'),
+        last_activity_at=F('memberships__last_activity_at'),
+        last_message_id=F('memberships__last_message'),
+    ).order_by('-last_activity_at', '-id').prefetch_related(
+        'participants', 'swapanza_participants').select_related('swapanza_requested_by')
+
+
+def serialize_chat_list(chats, context):
+    """ChatSerializerLight data for chats from ``user_chats``, last messages read in one query"""
+    context['last_messages'] = Message.objects.in_bulk(
+        [chat.last_message_id for chat in chats if chat.last_message_id])
+    return ChatSerializerLight(chats, many=True, context=context).data
+
+
 class ChatListCreateView(generics.ListCreateAPIView):
-    serializer_class = ChatSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ChatCursorPagination
+
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return ChatSerializerLight
+        return ChatSerializer
 
     def get_queryset(self):
-        return Chat.objects.filter(
-            participants=self.request.user
-        ).prefetch_related('participants').select_related('swapanza_requested_by')
+        return user_chats(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        chats = page if page is not None else list(queryset)
+        data = serialize_chat_list(chats, self.get_serializer_context())
+
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def create(self, request, *args, **kwargs):
+        """Find or create the chat (see ChatSerializer.create) and return it in the list shape.
+
+        Answers 201 for a new chat and 200 for an existing direct chat.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+
+        chats = list(self.get_queryset().filter(id=serializer.instance.id))
+        return Response(serialize_chat_list(chats, self.get_serializer_context())[0],
+                        status=status.HTTP_201_CREATED if serializer.created else status.HTTP_200_OK)
 
     def perform_create(self, serializer):
-        participants = self.request.data.get('participants', [])
+        participants = list(self.request.data.get('participants', []))
         participants.append(self.request.user.id)
         serializer.save(participants=participants)
 
 
+def versioned_response(request, build):
+    """``build()`` with the user's state version in ``X-State-Version``.
+
+    Answers 304 without calling ``build`` when ``?since_version=`` is still
+    the current version. The version is read first, so the state sent is at
+    least as new as the version it is labelled with.
+    """
+    version = current_version(request.user.id)
+    since_version = request.query_params.get('since_version')
+    if version is not None and since_version == str(version):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(build())
+    if version is not None:
+        response[STATE_VERSION_HEADER] = str(version)
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def bootstrap(request):
+    """Everything the client shows after login, in one response.
+
+    ``profile``, ``chats`` (as ``/api/chats/``), ``unread_counts`` (as
+    ``/api/unread-counts/``), ``swapanza`` (as ``/api/active-swapanza/``) and
+    ``server_time``, with the state version in ``X-State-Version``. Costs
+    five queries however many chats there are: the chats with their
+    memberships, their participants, their Swapanza participants, their last
+    messages and the user's Swapanza session. The profile comes from the
+    cached request user (see user_cache), so authentication adds a sixth
+    only on a cache miss. Unread counts come from the chats' membership
+    annotations.
+    """
+    user = request.user
+    version = current_version(user.id)
+    now = timezone.now()
+
+    chats = list(user_chats(user))
+    response = Response({
+        'profile': profile_data(user, user),
+        'chats': serialize_chat_list(chats, {'request': request}),
+        'unread_counts': {str(chat.id): chat.unread_count for chat in chats if chat.unread_count > 0},
+        'swapanza': swapanza_state(user.id, now=now),
+        'server_time': now.isoformat(),
+    })
+    if version is not None:
+        response[STATE_VERSION_HEADER] = str(version)
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def unread_message_counts(request):
-    """Get counts of unread messages for all chats - optimized single query"""
+    """Get counts of unread messages for all chats from the membership counters.
+
+    Pass ``?since_version=`` to get a 304 while nothing changed (see user_state).
+    """
     user = request.user
-    
-    chats_with_counts = Chat.objects.filter(
-        participants=user
-    ).annotate(
-        unread_count=Count(
-            'messages',
-            filter=~Q(messages__sender=user) & ~Q(messages__read_by=user)
-        )
-    ).filter(unread_count__gt=0).values('id', 'unread_count')
-    
-    unread_counts = {str(chat['id']): chat['unread_count'] for chat in chats_with_counts}
 
-    logger.info(f"Unread counts for user {user.username}: {unread_counts}")
-    return Response(unread_counts)
+    def build():
+        chats_with_counts = ChatMembership.objects.filter(
+            user=user, unread_count__gt=0
+        ).values('chat_id', 'unread_count')
+
+        unread_counts = {str(chat['chat_id']): chat['unread_count'] for chat in chats_with_counts}
+
+        logger.info(f"Unread counts for user {user.username}: {unread_counts}")
+        return unread_counts
+
+    return versioned_response(request, build)
 
 
 class ChatDetailView(generics.RetrieveUpdateAPIView):
-    queryset = Chat.objects.all().prefetch_related('messages__sender',
-                                                   'participants')
-    serializer_class = ChatSerializer
+    """Chat metadata without message history.
+
+    Pass ``?messages=N`` to also get the newest N messages (at most
+    ``max_messages``), read from the ``(chat, created_at)`` index. Older history
+    is paged through ``MessageListCreateView``.
+    """
+    serializer_class = ChatSerializerLight
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = pagination.PageNumberPagination
+    max_messages = 100
 
     def get_queryset(self):
+        membership = ChatMembership.objects.filter(chat=OuterRef('pk'),
+                                                   user=self.request.user)
+        return Chat.objects.annotate(
+            unread_count=Subquery(membership.values('unread_count')[:1]),
+            last_activity_at=Subquery(membership.values('last_activity_at')[:1]),
+            last_message_id=Subquery(membership.values('last_message')[:1]),
+        ).prefetch_related('participants').select_related('swapanza_requested_by')
 
-        return Chat.objects.prefetch_related('messages__sender',
-                                             'participants').all()
-
-    def get_object(self):
-        obj = super().get_object()
-
-        obj.messages.all()
-        return obj
+    def get_message_window(self):
+        """Number of recent messages requested with ``?messages=``, or None"""
+        value = self.request.query_params.get('messages')
+        if value is None:
+            return None
+        try:
+            count = int(value)
+        except ValueError:
+            raise ParseError('messages must be an integer')
+        return max(0, min(count, self.max_messages))
+
+    def serialize_chat(self, chat, message_window=None):
+        context = self.get_serializer_context()
+        context['last_messages'] = Message.objects.in_bulk(
+            [chat.last_message_id] if chat.last_message_id else [])
+        data = ChatSerializerLight(chat, context=context).data
+
+        if message_window is not None:
+            recent = Message.objects.filter(chat=chat).order_by('-seq')[:message_window]
+            data['messages'] = MessageSerializer(reversed(list(recent)), many=True).data
+        return data
 
     def update(self, request, *args, **kwargs):
         chat = self.get_object()
 
-        Message.objects.create(chat=chat,
-                               sender=request.user,
-                               content=request.data.get('content'))
+        message = Message.objects.create(chat=chat,
+                                         sender=request.user,
+                                         content=request.data.get('content'))
+        buffer_message(message)
+        publish_unread_counts(chat.id, exclude_user_id=request.user.id)
 
-        chat.refresh_from_db()
-        serializer = self.get_serializer(chat)
-        return Response(serializer.data)
+        chat = self.get_object()
+        return Response(self.serialize_chat(chat, self.get_message_window()))
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -272,7 +443,6 @@ class ChatDetailView(generics.RetrieveUpdateAPIView):
                 logger.info(f"Clearing stale Swapanza invite in chat {instance.id}")
                 instance.swapanza_requested_by = None
                 instance.swapanza_requested_at = None
-                instance.swapanza_confirmed_users = []
                 instance.swapanza_duration = None
                 needs_update = True
         
@@ -286,29 +456,28 @@ class ChatDetailView(generics.RetrieveUpdateAPIView):
             instance.swapanza_active = False
             instance.swapanza_started_at = None
             instance.swapanza_ends_at = None
-            instance.swapanza_message_count = {}
             needs_update = True
         
         if needs_update:
             update_fields = []
             if not swapanza_active:
                 update_fields.extend([
-                    'swapanza_active', 'swapanza_started_at', 'swapanza_ends_at', 'swapanza_message_count'
+                    'swapanza_active', 'swapanza_started_at', 'swapanza_ends_at'
                 ])
             if instance.swapanza_requested_by is None:
                 update_fields.extend([
-                    'swapanza_requested_by', 'swapanza_requested_at', 'swapanza_confirmed_users', 'swapanza_duration'
+                    'swapanza_requested_by', 'swapanza_requested_at', 'swapanza_duration'
                 ])
             instance.save(update_fields=update_fields)
+            broadcast_chat_invalidate(instance.id)
         
-        serializer = self.get_serializer(instance)
-        data = serializer.data
+        data = self.serialize_chat(instance, self.get_message_window())
         
         # Add computed fields
         data['swapanza_active'] = swapanza_active
         if swapanza_active:
             data['swapanza_ends_at'] = instance.swapanza_ends_at.isoformat() if instance.swapanza_ends_at else None
-            data['swapanza_message_count'] = instance.swapanza_message_count or {}
+            data['swapanza_message_count'] = instance.swapanza_message_count
 
         return Response(data)
 
@@ -317,10 +486,24 @@ logger = logging.getLogger(__name__)
 
 
 class MessageCursorPagination(pagination.CursorPagination):
+    """Newest-first pages keyed on the per-chat ``seq``, which never ties"""
     page_size = 30
-    ordering = '-created_at'
+    ordering = '-seq'
     cursor_query_param = 'cursor'
 
+    def get_first_page_response(self, request, messages):
+        """First-page response for already-serialized ``messages`` (newest first).
+
+        Builds the same ``next`` link ``paginate_queryset`` would, so a page
+        served from the message buffer pages on into the database seamlessly.
+        """
+        self.base_url = request.build_absolute_uri()
+        next_link = None
+        if messages and messages[-1]['seq'] > 1:
+            next_link = self.encode_cursor(pagination.Cursor(
+                offset=0, reverse=False, position=str(messages[-1]['seq'])))
+        return Response({'next': next_link, 'previous': None, 'results': messages})
+
 
 class MessageListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -332,7 +515,27 @@ class MessageListCreateView(generics.ListCreateAPIView):
         return Message.objects.filter(
             chat_id=chat_id,
             chat__participants=self.request.user
-        ).select_related('sender', 'apparent_sender').order_by('-created_at')
+        ).select_related('sender', 'apparent_sender').order_by('-seq')
+
+    def list(self, request, *args, **kwargs):
+        """Serve the newest page from the message buffer when it holds all of it"""
+        if self.paginator.cursor_query_param in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        chat_id = self.kwargs['chat_id']
+        last_seq = ChatMembership.objects.filter(
+            chat_id=chat_id, user=request.user).values_list(
+                'chat__last_seq', flat=True).first()
+        if last_seq is None:
+            return self.paginator.get_first_page_response(request, [])
+
+        page_size = self.paginator.page_size
+        messages = get_recent_messages(chat_id, last_seq, page_size)
+        if messages is None:
+            page = list(self.get_queryset()[:page_size])
+            messages = self.get_serializer(page, many=True).data
+            refill_buffer(chat_id, messages)
+        return self.paginator.get_first_page_response(request, messages)
 
     def create(self, request, *args, **kwargs):
         chat_id = self.kwargs['chat_id']
@@ -352,6 +555,8 @@ class MessageListCreateView(generics.ListCreateAPIView):
             traceback.print_exc()
             return Response({'detail': 'Error saving message.'},
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        buffer_message(message)
+        publish_unread_counts(chat.id, exclude_user_id=request.user.id)
 
         return Response(self.get_serializer(message).data,
                         status=status.HTTP_201_CREATED)
@@ -360,23 +565,32 @@ class MessageListCreateView(generics.ListCreateAPIView):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def reset_notifications(request):
-    """Reset all unread messages for the user - optimized bulk operation"""
+    """Reset all unread messages for the user by advancing every read watermark.
+
+    The first ``NOTIFICATION_RESET_CHUNK_SIZE`` counters are cleared here. If
+    more are left the rest is handed to a Celery task and the answer is 202;
+    the task pushes ``notifications.reset`` progress to the user's socket.
+    """
     user = request.user
+    chunk_size = getattr(settings, 'NOTIFICATION_RESET_CHUNK_SIZE', 500)
 
-    unread_messages = Message.objects.filter(
-        chat__participants=user
-    ).exclude(read_by=user).exclude(sender=user)
-    
-    total_updated = unread_messages.count()
-    
-    ReadBy = Message.read_by.through
-    read_by_records = [
-        ReadBy(message_id=msg_id, user_id=user.id)
-        for msg_id in unread_messages.values_list('id', flat=True)
-    ]
-    ReadBy.objects.bulk_create(read_by_records, ignore_conflicts=True)
-
-    return Response({"message": f"Reset {total_updated} notifications"},
+    cleared, counters = ChatMembership.mark_read_chunk(user.id, chunk_size)
+    if counters == chunk_size:
+        try:
+            reset_user_notifications.delay(user.id, cleared)
+            return Response({"message": "Resetting notifications",
+                             "cleared": cleared,
+                             "pending": True},
+                            status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            logger.error(f"Error queueing notification reset for user {user.id}: {str(e)}")
+            cleared = clear_unread(user.id, cleared)
+
+    if cleared:
+        publish_unread_cleared(user.id)
+    return Response({"message": f"Reset {cleared} notifications",
+                     "cleared": cleared,
+                     "pending": False},
                     status=status.HTTP_200_OK)
 
 
@@ -420,10 +634,6 @@ def cancel_swapanza(request):
             chat.swapanza_requested_by = None
             instance_updated = True
             
-        if chat.swapanza_confirmed_users:
-            chat.swapanza_confirmed_users = []
-            instance_updated = True
-            
         if chat.swapanza_requested_at:
             chat.swapanza_requested_at = None
             instance_updated = True
@@ -437,7 +647,6 @@ def cancel_swapanza(request):
             chat.swapanza_active = False
             chat.swapanza_started_at = None
             chat.swapanza_ends_at = None
-            chat.swapanza_message_count = {}
             instance_updated = True
             
             # Deactivate any active sessions
@@ -446,13 +655,14 @@ def cancel_swapanza(request):
                 chat=chat, 
                 active=True
             ).update(active=False)
+            publish_swapanza_state(chat.participants.values_list('id', flat=True))
         
         if instance_updated:
             chat.save(update_fields=[
-                'swapanza_requested_by', 'swapanza_confirmed_users', 
+                'swapanza_requested_by',
                 'swapanza_requested_at', 'swapanza_duration',
                 'swapanza_active', 'swapanza_started_at', 
-                'swapanza_ends_at', 'swapanza_message_count'
+                'swapanza_ends_at'
             ])
             
         logger.info(f"Cleared all Swapanza state for chat {chat.id} by user {user.username}")
@@ -491,69 +701,12 @@ def cancel_swapanza(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_active_swapanza(request):
-    """Get active Swapanza session for the current user"""
-    user = request.user
-    now = timezone.now()
+    """Get active Swapanza session for the current user.
 
-    
+    Pass ``?since_version=`` to get a 304 while nothing changed (see user_state).
+    """
     chat_id = request.query_params.get('chat_id')
-
-    
-    active_session = SwapanzaSession.objects.filter(user=user,
-                                                    active=True,
-                                                    ends_at__gt=now).first()
-
-    if not active_session:
-        return Response({'active': False})
-
-    
-    partner = active_session.partner
-    session_chat = active_session.chat
-
-    
-    chat_specific_count = 0
-    if chat_id:
-        try:
-            current_chat = Chat.objects.get(id=chat_id)
-            chat_message_counts = current_chat.swapanza_message_count or {}
-            chat_specific_count = chat_message_counts.get(str(user.id), 0)
-        except Chat.DoesNotExist:
-            pass
-
-    
-    total_message_count = Message.objects.filter(
-        sender=user,
-        during_swapanza=True,
-        created_at__gte=active_session.started_at).count()
-
-    
-    remaining_messages = max(0, 2 - total_message_count)
-
-    return Response({
-        'active':
-        True,
-        'partner_id':
-        partner.id,
-        'partner_username':
-        partner.username,
-        'partner_profile_image':
-        partner.profile_image_url
-        if hasattr(partner, 'profile_image_url') else None,
-        'ends_at':
-        active_session.ends_at,
-        'started_at':
-        active_session.started_at,
-        'message_count':
-        total_message_count,
-        'chat_specific_count':
-        chat_specific_count,
-        'remaining_messages':
-        remaining_messages,
-        'chat_id':
-        session_chat.id if session_chat else None,
-        'server_time':
-        now.isoformat()
-    })
+    return versioned_response(request, lambda: swapanza_state(request.user.id, chat_id))
 
 
 @api_view(['GET'])
@@ -589,7 +742,8 @@ class ChatListView(generics.ListCreateAPIView):
         user = self.request.user
         return Chat.objects.filter(
             participants=user
-        ).prefetch_related('participants').select_related('swapanza_requested_by').order_by('-id')
+        ).prefetch_related('participants', 'swapanza_participants').select_related(
+            'swapanza_requested_by').order_by('-id')
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -605,7 +759,7 @@ class ChatListView(generics.ListCreateAPIView):
             if chat.swapanza_requested_by:
                 chat_data['swapanza_requested_by'] = chat.swapanza_requested_by.id
                 chat_data['swapanza_duration'] = chat.swapanza_duration
-                chat_data['swapanza_confirmed_users'] = chat.swapanza_confirmed_users or []
+                chat_data['swapanza_confirmed_users'] = chat.swapanza_confirmed_users
                 if chat.swapanza_requested_at:
                     chat_data['swapanza_requested_at'] = chat.swapanza_requested_at.isoformat()
 
@@ -617,6 +771,6 @@ class ChatListView(generics.ListCreateAPIView):
 
             if chat_data['swapanza_active']:
                 chat_data['swapanza_ends_at'] = chat.swapanza_ends_at.isoformat()
-                chat_data['swapanza_message_count'] = chat.swapanza_message_count or {}
+                chat_data['swapanza_message_count'] = chat.swapanza_message_count
 
         return Response(data)
@@ -0,0 +1,168 @@
+"""Compact binary WebSocket frames, negotiated with the ``swapanza.msgpack.v1`` subprotocol.
+
+Frames are JSON text by default. A client that offers ``swapanza.msgpack.v1``
+in ``Sec-WebSocket-Protocol`` gets the same frames as binary msgpack where
+
+- known keys are replaced by the small integers in ``FIELD_CODES``,
+- known ``type`` values are replaced by the integers in ``TYPE_CODES``,
+- ISO timestamps in ``TIMESTAMP_FIELDS`` become msgpack timestamps.
+
+Unknown keys and types are sent as strings, so either side can add fields
+without a new protocol version. Clients send frames the same way. Codes are
+append-only: never renumber or reuse one within ``v1``.
+"""
+from datetime import datetime
+
+import msgpack
+
+MSGPACK_SUBPROTOCOL = 'swapanza.msgpack.v1'
+
+FIELD_CODES = {
+    'type': 0,
+    'chat_id': 1,
+    'id': 2,
+    'seq': 3,
+    'sender': 4,
+    'content': 5,
+    'created_at': 6,
+    'during_swapanza': 7,
+    'apparent_sender': 8,
+    'apparent_sender_username': 9,
+    'apparent_sender_profile_image': 10,
+    'remaining_messages': 11,
+    'client_id': 12,
+    'message': 13,
+    'messages': 14,
+    'after_seq': 15,
+    'last_seq': 16,
+    'truncated': 17,
+    'user_id': 18,
+    'username': 19,
+    'profile_image_url': 20,
+    'server_time': 21,
+    'participants': 22,
+    'unread_cleared': 23,
+    'swapanza': 24,
+    'swapanza_request': 25,
+    'requested_by': 26,
+    'requested_by_username': 27,
+    'requested_at': 28,
+    'duration': 29,
+    'confirmed_users': 30,
+    'all_confirmed': 31,
+    'started_at': 32,
+    'ends_at': 33,
+    'partner_id': 34,
+    'partner_username': 35,
+    'partner_profile_image': 36,
+    'message_count': 37,
+    'force_redirect': 38,
+    'cancelled_by': 39,
+    'cancelled_by_username': 40,
+    'count': 41,
+    'from': 42,
+    'frame': 43,
+    'code': 44,
+    'version': 45,
+    'counts': 46,
+    'chat_specific_count': 47,
+    'cleared': 48,
+    'done': 49,
+}
+
+TYPE_CODES = {
+    'init': 0,
+    'chat.message': 1,
+    'chat.message.error': 2,
+    'chat.messages_read': 3,
+    'chat.replay': 4,
+    'swapanza.request': 5,
+    'swapanza.confirm': 6,
+    'swapanza.activate': 7,
+    'swapanza.expire': 8,
+    'swapanza.cancel': 9,
+    'swapanza.logout': 10,
+    'error': 11,
+    'ping': 12,
+    'pong': 13,
+    'unread_count': 14,
+    'swapanza_invite': 15,
+    'swapanza_cancel': 16,
+    'subscribe': 17,
+    'unsubscribe': 18,
+    'chat.frame': 19,
+    'chat.closed': 20,
+    'unread_counts': 21,
+    'swapanza.state': 22,
+    'notifications.reset': 23,
+}
+
+TIMESTAMP_FIELDS = frozenset({
+    'created_at', 'server_time', 'requested_at', 'started_at', 'ends_at',
+})
+
+FIELD_NAMES = {code: name for name, code in FIELD_CODES.items()}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+
+
+def _compact(value):
+    if isinstance(value, dict):
+        compact = {}
+        for key, item in value.items():
+            if key == 'type':
+                item = TYPE_CODES.get(item, item)
+            elif key in TIMESTAMP_FIELDS and isinstance(item, str):
+                try:
+                    parsed = datetime.fromisoformat(item)
+                except ValueError:
+                    parsed = None
+                if parsed is not None and parsed.tzinfo is not None:
+                    item = parsed
+            else:
+                item = _compact(item)
+            compact[FIELD_CODES.get(key, key)] = item
+        return compact
+    if isinstance(value, list):
+        return [_compact(item) for item in value]
+    return value
+
+
+def _expand(value):
+    if isinstance(value, dict):
+        expanded = {}
+        for key, item in value.items():
+            key = FIELD_NAMES.get(key, key)
+            if key == 'type':
+                item = TYPE_NAMES.get(item, item)
+            elif isinstance(item, datetime):
+                item = item.isoformat()
+            else:
+                item = _expand(item)
+            expanded[key] = item
+        return expanded
+    if isinstance(value, list):
+        return [_expand(item) for item in value]
+    return value
+
+
+def encode_msgpack(frame):
+    """Pack a JSON-style frame into compact msgpack bytes"""
+    return msgpack.packb(_compact(frame), datetime=True)
+
+
+def decode_msgpack(data):
+    """Unpack compact msgpack bytes into the equivalent JSON-style frame"""
+    return _expand(msgpack.unpackb(data, strict_map_key=False, timestamp=3))
+
+
+def wrap_msgpack(envelope, frame_bytes):
+    """Msgpack of ``envelope`` with a ``frame`` key holding the packed ``frame_bytes``.
+
+    Nests an already encoded frame (e.g. in ``chat.frame``) without unpacking it.
+    """
+    packer = msgpack.Packer(datetime=True)
+    compact = _compact(envelope)
+    data = packer.pack_map_header(len(compact) + 1)
+    for key, value in compact.items():
+        data += packer.pack(key) + packer.pack(value)
+    return data + packer.pack(FIELD_CODES['frame']) + frame_bytes
@@ -15,11 +15,14 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+# Expiries and stale invites are scheduled for their exact time when they are
+# created (see api.tasks.schedule_swapanza_expiry); this sweep only catches
+# tasks that were lost, so it can run rarely.
 app.conf.beat_schedule = {
     
     'check-expired-swapanzas': {
         'task': 'api.tasks.check_expired_swapanzas',
-        'schedule': 10.0,  
+        'schedule': 300.0,  
     },
 }
 
@@ -121,11 +121,13 @@ DATABASES = {
 
 
 CORS_ALLOW_CREDENTIALS = os.environ.get('CORS_ALLOW_CREDENTIALS', 'False') == 'True'
+# Lets the frontend read the state version of unread/Swapanza responses
+CORS_EXPOSE_HEADERS = ['X-State-Version']
 
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
 }
 
@@ -186,6 +188,10 @@ else:
         },
     }
 
+# Unread counters cleared per transaction by /api/reset-notifications/; a user
+# with more than this many unread chats is reset by a Celery task
+NOTIFICATION_RESET_CHUNK_SIZE = int(os.environ.get('NOTIFICATION_RESET_CHUNK_SIZE', 500))
+
 
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL') 
 CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND') 
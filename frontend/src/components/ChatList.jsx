@@ -76,44 +76,25 @@ function ChatList() {
     async (otherUserId) => {
       try {
         // Check for existing chat with this user
-        let existingChat = chats.find((chat) =>
+        const existingChat = chats.find((chat) =>
           chat.participants.some((participant) => Number(participant.id) === Number(otherUserId))
         );
 
-        // If not found in visible chats, check on the server
-        if (!existingChat) {
-          try {
-            const response = await axios.get(`/api/chats/find-by-user/${otherUserId}/`, {
-              headers: { Authorization: `Bearer ${token}` },
-            });
-
-            if (response.data && response.data.id) {
-              existingChat = response.data;
-
-              // Remove from closed chats if it was closed
-              reopenChat(existingChat.id);
-
-              // Add to visible chats if not already there
-              addChat(existingChat);
-            }
-          } catch (error) {
-            // Chat doesn't exist on server yet
-          }
-        }
-
         if (existingChat) {
           clearSearch();
           openModalEnhanced(existingChat.id);
           return;
         }
 
-        // Create a new chat
+        // Find or create the direct chat on the server in one request
         const response = await axios.post(
           '/api/chats/',
           { participants: [otherUserId] },
           { headers: { Authorization: `Bearer ${token}` } }
         );
 
+        // An existing chat may have been closed
+        reopenChat(response.data.id);
         addChat(response.data);
         clearSearch();
         openModalEnhanced(response.data.id);
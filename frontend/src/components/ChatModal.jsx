@@ -44,6 +44,8 @@ function ChatModal({ chatId, onClose, onMessagesRead, onNewMessage, hasPendingSw
     fetchChat,
     loadMoreMessages,
     handleChatMessage,
+    handleReplay,
+    getLastSeq,
     handleMessageError,
     clearPendingMessages,
   } = useChatMessages({
@@ -74,9 +76,27 @@ function ChatModal({ chatId, onClose, onMessagesRead, onNewMessage, hasPendingSw
   const handleWsMessage = useCallback(
     (data) => {
       switch (data.type) {
+        case 'init':
+          // Connect snapshot: running Swapanza and any pending invite
+          if (data.swapanza) {
+            swapanza.handleSwapanzaActivate({ ...data.swapanza, server_time: data.server_time });
+            swapanza.updateRemainingMessages(data.swapanza.remaining_messages);
+          } else if (data.swapanza_request) {
+            swapanza.handleSwapanzaRequest(data.swapanza_request);
+            data.swapanza_request.confirmed_users.forEach((userId) =>
+              swapanza.handleSwapanzaConfirm({ user_id: userId, all_confirmed: false })
+            );
+          }
+          break;
         case 'chat.message': {
           const messageData = data.message || data;
 
+          // A jump in seq means frames were missed; ask the server for the gap
+          const lastSeq = getLastSeq();
+          if (lastSeq && messageData.seq > lastSeq + 1) {
+            sendWsMessageRef.current?.({ type: 'chat.replay', after_seq: lastSeq });
+          }
+
           // Update remaining messages during Swapanza
           if (
             swapanza.isSwapanzaActive &&
@@ -94,6 +114,15 @@ function ChatModal({ chatId, onClose, onMessagesRead, onNewMessage, hasPendingSw
           }
           break;
         }
+        case 'chat.replay':
+          handleReplay(data.messages);
+          if (data.truncated && data.messages.length) {
+            sendWsMessageRef.current?.({
+              type: 'chat.replay',
+              after_seq: data.messages[data.messages.length - 1].seq,
+            });
+          }
+          break;
         case 'chat.messages_read':
           onMessagesRead?.();
           break;
@@ -127,7 +156,9 @@ function ChatModal({ chatId, onClose, onMessagesRead, onNewMessage, hasPendingSw
     },
     [
       currentUserId,
+      getLastSeq,
       handleChatMessage,
+      handleReplay,
       handleMessageError,
       handleSwapanzaLogout,
       onMessagesRead,
@@ -146,6 +177,7 @@ function ChatModal({ chatId, onClose, onMessagesRead, onNewMessage, hasPendingSw
     token,
     onMessage: handleWsMessage,
     onMessagesRead,
+    getLastSeq,
     onOpen: () => {
       onMessagesRead?.();
     },
@@ -4,6 +4,7 @@ import { useNavigate, Link } from 'react-router-dom';
 import axios from '../utils/axiosConfig';
 import { toast } from 'react-toastify';
 import { useAuth } from '../hooks/useAuth';
+import { primeBootstrap } from '../utils/bootstrap';
 
 function LoginForm() {
   const [username, setUsername] = useState('');
@@ -24,13 +25,15 @@ function LoginForm() {
 
       const token = response.data.access;
 
-      const profileResponse = await axios.get('/api/profile/', {
+      // Everything the chat list needs, fetched once and handed over
+      const bootstrapResponse = await axios.get('/api/bootstrap/', {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
+      primeBootstrap(token, bootstrapResponse);
 
-      const userId = profileResponse.data.id;
+      const userId = bootstrapResponse.data.profile.id;
       login(token, username, userId);
 
       toast.success(`Welcome back, ${username}!`);
@@ -2,7 +2,9 @@ import { useState, useEffect, useCallback, useRef } from 'react';
 import axios from '../utils/axiosConfig';
 import { toast } from 'react-toastify';
 import { useAuth } from './useAuth';
-import { INTERVALS, WS_CODES } from '../constants';
+import { INTERVALS } from '../constants';
+import { getUserSocket } from '../utils/userSocket';
+import { loadBootstrap } from '../utils/bootstrap';
 
 /**
  * Custom hook for managing chat list data, WebSocket, and state
@@ -12,13 +14,15 @@ export function useChatListData() {
 
   // WebSocket state
   const [wsConnected, setWsConnected] = useState(false);
-  const notificationWsRef = useRef(null);
   const wsErrorShownRef = useRef(false);
 
   // Chat state
   const [chats, setChats] = useState([]);
   const [unreadCounts, setUnreadCounts] = useState({});
+  // State version the unread counts are current to (see utils/userSocket)
+  const unreadVersionRef = useRef(null);
   const [currentUserProfile, setCurrentUserProfile] = useState(null);
+  const [activeSwapanza, setActiveSwapanza] = useState(null);
 
   // Closed chats state (persisted to localStorage)
   const [closedChatIds, setClosedChatIds] = useState(() => {
@@ -49,20 +53,14 @@ export function useChatListData() {
     }
   }, [closedChatIds]);
 
-  // Fetch current user profile
-  const fetchCurrentUserProfile = useCallback(async () => {
-    if (!token || !currentUserId) return;
-
-    try {
-      const response = await axios.get(`/api/profile/${currentUserId}/`, {
-        headers: { Authorization: `Bearer ${token}` },
-      });
-      setCurrentUserProfile(response.data);
-    } catch (error) {
-      console.error('Error fetching user profile:', error);
-      toast.error('Error fetching user profile');
-    }
-  }, [token, currentUserId]);
+  // Keep the chats that weren't closed
+  const applyChats = useCallback(
+    (chatList) => {
+      const closed = getClosedChatIds();
+      setChats((chatList || []).filter((c) => !closed.includes(c.id.toString())));
+    },
+    [getClosedChatIds]
+  );
 
   // Fetch chats from the backend
   const fetchChats = useCallback(async () => {
@@ -72,36 +70,54 @@ export function useChatListData() {
         headers: { Authorization: `Bearer ${token}` },
         params: { include_closed: true },
       });
-      const closed = getClosedChatIds();
-      const filtered = (response.data || []).filter((c) => !closed.includes(c.id.toString()));
-      setChats(filtered);
+      applyChats(response.data);
     } catch (error) {
       console.error('Error fetching chats:', error);
       toast.error('Error fetching chats');
     }
-  }, [token, getClosedChatIds]);
-
-  // Fetch unread message counts
-  const fetchUnreadCounts = useCallback(async () => {
-    if (!token) return;
-    try {
-      const response = await axios.get('/api/unread-counts/', {
-        headers: { Authorization: `Bearer ${token}` },
-      });
+  }, [token, applyChats]);
 
+  // Keep the non-zero counts of open chats
+  const applyUnreadCounts = useCallback(
+    (counts) => {
       const closed = getClosedChatIds();
       const filteredCounts = {};
-      Object.entries(response.data).forEach(([chatId, count]) => {
+      Object.entries(counts).forEach(([chatId, count]) => {
         if (!closed.includes(chatId.toString()) && count > 0) {
           filteredCounts[chatId] = count;
         }
       });
-
       setUnreadCounts(filteredCounts);
-    } catch (error) {
-      console.error('Error fetching unread counts:', error.response || error);
-    }
-  }, [token, getClosedChatIds]);
+    },
+    [getClosedChatIds]
+  );
+
+  // Fetch unread message counts; with ifChanged, only if they changed since
+  // the last fetch or push. Resolves to whether new counts were applied.
+  const fetchUnreadCounts = useCallback(
+    async ({ ifChanged = false } = {}) => {
+      if (!token) return false;
+      try {
+        const sinceVersion = ifChanged ? unreadVersionRef.current : null;
+        const response = await axios.get('/api/unread-counts/', {
+          headers: { Authorization: `Bearer ${token}` },
+          params: sinceVersion !== null ? { since_version: sinceVersion } : {},
+          validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+        });
+
+        const version = response.headers['x-state-version'];
+        if (version !== undefined) unreadVersionRef.current = Number(version);
+        if (response.status === 304) return false;
+
+        applyUnreadCounts(response.data);
+        return true;
+      } catch (error) {
+        console.error('Error fetching unread counts:', error.response || error);
+        return false;
+      }
+    },
+    [token, applyUnreadCounts]
+  );
 
   // Remove a chat (mark as closed)
   const removeChat = useCallback(
@@ -135,16 +151,21 @@ export function useChatListData() {
     fetchUnreadCounts();
   }, [chats, getClosedChatIds, fetchChats, fetchUnreadCounts, persistClosedChatIds]);
 
-  // Reset all notifications
+  // Reset all notifications. Large backlogs finish in the background: the
+  // socket then pushes progress and the final counts
   const resetAllNotifications = useCallback(async () => {
     try {
-      await axios.post(
+      const response = await axios.post(
         '/api/reset-notifications/',
         {},
         { headers: { Authorization: `Bearer ${token}` } }
       );
       setUnreadCounts({});
-      fetchUnreadCounts();
+      if (response.data.pending) {
+        toast.info('Clearing notifications...');
+      } else {
+        fetchUnreadCounts();
+      }
     } catch (error) {
       console.error('Error resetting notifications:', error);
     }
@@ -176,20 +197,39 @@ export function useChatListData() {
   const totalUnreadMessages =
     Object.values(unreadCounts).reduce((sum, count) => sum + (count > 0 ? count : 0), 0) || 0;
 
-  // Initial data fetch
+  // Initial data: profile, chats, unread counts and Swapanza in one request
+  const loadInitialState = useCallback(async () => {
+    if (!token) return;
+    try {
+      const response = await loadBootstrap(token);
+      const version = response.headers['x-state-version'];
+      if (version !== undefined) unreadVersionRef.current = Number(version);
+
+      setCurrentUserProfile(response.data.profile);
+      applyChats(response.data.chats);
+      applyUnreadCounts(response.data.unread_counts);
+      setActiveSwapanza(response.data.swapanza);
+    } catch (error) {
+      console.error('Error loading initial state:', error);
+      toast.error('Error loading chats');
+    }
+    // Reload only for a new user, not when the closed chats change
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [token]);
+
   useEffect(() => {
-    fetchCurrentUserProfile();
-    fetchChats();
-    fetchUnreadCounts();
-  }, [fetchCurrentUserProfile, fetchChats, fetchUnreadCounts]);
+    loadInitialState();
+  }, [loadInitialState]);
 
-  // Poll if WebSocket is not connected
+  // Poll if WebSocket is not connected; unchanged counts cost a 304 and
+  // skip the chat list refresh
   useEffect(() => {
     let interval = null;
     if (!wsConnected) {
-      interval = setInterval(() => {
-        fetchChats();
-        fetchUnreadCounts();
+      interval = setInterval(async () => {
+        if (await fetchUnreadCounts({ ifChanged: true })) {
+          fetchChats();
+        }
       }, INTERVALS.SWAPANZA_STATE_CHECK_MS);
     }
     return () => {
@@ -197,54 +237,19 @@ export function useChatListData() {
     };
   }, [wsConnected, fetchChats, fetchUnreadCounts]);
 
-  // WebSocket connection
+  // Notifications over the shared user socket
   useEffect(() => {
     if (!token || !currentUserId) return;
 
-    let ws = null;
-    let pingInterval = null;
-    let pongTimeout = null;
-    let reconnectTimeout = null;
-    let mountedRef = { current: true };
-    let reconnectAttempt = 0;
-    let isReconnecting = false;
-
-    const cleanup = () => {
-      if (pingInterval) clearInterval(pingInterval);
-      if (pongTimeout) clearTimeout(pongTimeout);
-      if (reconnectTimeout) clearTimeout(reconnectTimeout);
-      if (ws) {
-        try {
-          ws.close();
-        } catch (err) {
-          console.warn('Error closing websocket:', err);
-        }
-        ws = null;
+    const handleMessage = (data) => {
+      if (data.type === 'state.gap') {
+        fetchUnreadCounts({ ifChanged: true }).then((changed) => changed && fetchChats());
+        return;
+      }
+      if (typeof data.version === 'number') {
+        unreadVersionRef.current = data.version;
       }
-    };
-
-    const startPing = () => {
-      if (!ws || ws.readyState !== WebSocket.OPEN) return;
-
-      if (pingInterval) clearInterval(pingInterval);
-      if (pongTimeout) clearTimeout(pongTimeout);
-
-      ws.send(JSON.stringify({ type: 'ping' }));
-
-      pingInterval = setInterval(() => {
-        if (ws && ws.readyState === WebSocket.OPEN) {
-          ws.send(JSON.stringify({ type: 'ping' }));
-          pongTimeout = setTimeout(() => {
-            console.warn('No pong received in 45s');
-            if (ws && ws.readyState === WebSocket.OPEN) {
-              ws.close(3000, 'No pong received');
-            }
-          }, 45000);
-        }
-      }, 60000);
-    };
 
-    const handleMessage = (data) => {
       const closed = getClosedChatIds();
       const chatIdStr = data.chat_id?.toString();
       if (chatIdStr && closed.includes(chatIdStr)) {
@@ -253,6 +258,14 @@ export function useChatListData() {
 
       if (data.type === 'unread_count') {
         setUnreadCounts((prev) => ({ ...prev, [data.chat_id]: data.count }));
+      } else if (data.type === 'unread_counts') {
+        applyUnreadCounts(data.counts);
+      } else if (data.type === 'swapanza.state') {
+        setActiveSwapanza(data.swapanza);
+      } else if (data.type === 'notifications.reset') {
+        if (data.done) {
+          toast.success(`Cleared ${data.cleared} notifications`);
+        }
       } else if (data.type === 'swapanza_invite') {
         setUnreadCounts((prev) => ({ ...prev, [data.chat_id]: -1 }));
         toast.info(`Swapanza invite from ${data.from}! Click to view.`, {
@@ -265,85 +278,23 @@ export function useChatListData() {
       }
     };
 
-    const connect = () => {
-      if (isReconnecting || !mountedRef.current) return;
-      isReconnecting = true;
-
-      cleanup();
-
-      try {
-        const host = window.location.hostname;
-        const wsUrl = `ws://${host}:8000/ws/notifications/?token=${token}`;
-        ws = new WebSocket(wsUrl);
-        notificationWsRef.current = ws;
-
-        ws.onopen = () => {
-          if (!mountedRef.current) return;
-          setWsConnected(true);
-          wsErrorShownRef.current = false;
-          reconnectAttempt = 0;
-          isReconnecting = false;
-          startPing();
-        };
-
-        ws.onclose = (e) => {
-          if (!mountedRef.current) return;
-          setWsConnected(false);
-          cleanup();
-
-          if (e.code !== WS_CODES.NORMAL_CLOSURE && !wsErrorShownRef.current) {
-            wsErrorShownRef.current = true;
-            if (e.code !== 3000) {
-              toast.error('Connection lost. Reconnecting...');
-            }
-          }
-
-          if (mountedRef.current && e.code !== WS_CODES.NORMAL_CLOSURE) {
-            const delay = Math.min(
-              WS_CODES.RECONNECT_BASE_MS * Math.pow(2, reconnectAttempt++),
-              INTERVALS.WS_MAX_RECONNECT_DELAY_MS
-            );
-            isReconnecting = false;
-            reconnectTimeout = setTimeout(connect, delay);
-          }
-        };
-
-        ws.onerror = () => {
-          // Error handling is done in onclose
-        };
-
-        ws.onmessage = (event) => {
-          if (!mountedRef.current) return;
-          try {
-            const data = JSON.parse(event.data);
-            if (data.type === 'pong') {
-              if (pongTimeout) clearTimeout(pongTimeout);
-              return;
-            }
-            handleMessage(data);
-          } catch (err) {
-            console.error('Error handling message:', err);
-          }
-        };
-      } catch (err) {
-        console.error('Error creating WebSocket:', err);
-        isReconnecting = false;
-        if (mountedRef.current) {
-          const delay = Math.min(
-            WS_CODES.RECONNECT_BASE_MS * Math.pow(2, reconnectAttempt++),
-            INTERVALS.WS_MAX_RECONNECT_DELAY_MS
-          );
-          reconnectTimeout = setTimeout(connect, delay);
-        }
+    const socket = getUserSocket(token);
+    let wasConnected = false;
+    const stopStatus = socket.onStatusChange((status) => {
+      setWsConnected(status === 'connected');
+      if (status === 'connected') {
+        wasConnected = true;
+        wsErrorShownRef.current = false;
+      } else if (status === 'disconnected' && wasConnected && !wsErrorShownRef.current) {
+        wsErrorShownRef.current = true;
+        toast.error('Connection lost. Reconnecting...');
       }
-    };
-
-    mountedRef.current = true;
-    setTimeout(connect, 200);
+    });
+    const stopListening = socket.addListener(handleMessage);
 
     return () => {
-      mountedRef.current = false;
-      cleanup();
+      stopStatus();
+      stopListening();
     };
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [token, currentUserId]);
@@ -353,6 +304,7 @@ export function useChatListData() {
     chats,
     unreadCounts,
     currentUserProfile,
+    activeSwapanza,
     wsConnected,
     totalUnreadMessages,
     currentUserId,
@@ -15,6 +15,18 @@ export function useChatMessages({ chatId, token, currentUserId }) {
   const [nextCursor, setNextCursor] = useState(null);
 
   const pendingMessages = useRef([]);
+  // Highest per-chat sequence number seen, used for gap detection and replay
+  const lastSeqRef = useRef(0);
+
+  const trackSeq = useCallback((items) => {
+    items.forEach((m) => {
+      if (m.seq > lastSeqRef.current) {
+        lastSeqRef.current = m.seq;
+      }
+    });
+  }, []);
+
+  const getLastSeq = useCallback(() => lastSeqRef.current, []);
 
   // Fetch chat metadata and initial messages
   const fetchChat = useCallback(async () => {
@@ -38,6 +50,8 @@ export function useChatMessages({ chatId, token, currentUserId }) {
 
       // Messages come newest-first from API, reverse for chronological display
       const fetchedMessages = messagesResponse.data.results || messagesResponse.data || [];
+      lastSeqRef.current = 0;
+      trackSeq(fetchedMessages);
       setMessages(fetchedMessages.slice().reverse());
 
       // Handle pagination cursors
@@ -56,7 +70,7 @@ export function useChatMessages({ chatId, token, currentUserId }) {
       setLoading(false);
       return null;
     }
-  }, [chatId, token]);
+  }, [chatId, token, trackSeq]);
 
   // Load older messages (pagination)
   const loadMoreMessages = useCallback(async () => {
@@ -87,6 +101,7 @@ export function useChatMessages({ chatId, token, currentUserId }) {
     if (!message || (!message.id && !message.content)) {
       return;
     }
+    trackSeq([message]);
 
     setMessages((prevMessages) => {
       let updatedMessages = [...prevMessages];
@@ -119,7 +134,30 @@ export function useChatMessages({ chatId, token, currentUserId }) {
       // Add as new message
       return [...updatedMessages, { ...message, pending: false }];
     });
-  }, []);
+  }, [trackSeq]);
+
+  // Merge messages replayed by the server after a reconnect or a detected gap
+  const handleReplay = useCallback(
+    (replayed) => {
+      if (!replayed?.length) return;
+      trackSeq(replayed);
+
+      setMessages((prevMessages) => {
+        const known = new Set(prevMessages.map((m) => m.id));
+        const missing = replayed
+          .filter((m) => !known.has(m.id))
+          .map((m) => ({ ...m, pending: false }));
+        if (!missing.length) return prevMessages;
+
+        // Keep confirmed messages in seq order; pending ones stay at the end
+        const confirmed = [...prevMessages.filter((m) => !m.pending), ...missing].sort(
+          (a, b) => (a.seq || 0) - (b.seq || 0)
+        );
+        return [...confirmed, ...prevMessages.filter((m) => m.pending)];
+      });
+    },
+    [trackSeq]
+  );
 
   // Handle message error from WebSocket
   const handleMessageError = useCallback((data) => {
@@ -153,6 +191,8 @@ export function useChatMessages({ chatId, token, currentUserId }) {
     fetchChat,
     loadMoreMessages,
     handleChatMessage,
+    handleReplay,
+    getLastSeq,
     handleMessageError,
     getOtherParticipant,
     clearPendingMessages,
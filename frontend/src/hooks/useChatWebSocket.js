@@ -1,16 +1,21 @@
 import { useState, useRef, useCallback, useEffect } from 'react';
-import { WS_CODES, INTERVALS } from '../constants';
+import { getUserSocket } from '../utils/userSocket';
 
 /**
- * Custom hook to manage WebSocket connection for chat
- * Handles connection, reconnection, and message sending
+ * Custom hook to manage a chat's stream on the shared user WebSocket
+ * Handles subscription, resubscription, and message sending
  */
-export function useChatWebSocket({ chatId, token, onMessage, onMessagesRead, onOpen }) {
+export function useChatWebSocket({ chatId, token, onMessage, onMessagesRead, onOpen, getLastSeq }) {
   const [connectionStatus, setConnectionStatus] = useState('disconnected');
-  const ws = useRef(null);
-  const wsRetryCount = useRef(0);
+  const socketRef = useRef(null);
+  const unsubscribeRef = useRef(null);
+  const statusUnsubscribeRef = useRef(null);
   const setupWebSocketRef = useRef(null);
 
+  // Latest callbacks, read when frames arrive so a subscription never sees stale ones
+  const callbacksRef = useRef({});
+  callbacksRef.current = { onMessage, onMessagesRead, onOpen, getLastSeq };
+
   // Check if token is expired
   const isTokenExpired = useCallback((tokenStr) => {
     try {
@@ -28,7 +33,7 @@ export function useChatWebSocket({ chatId, token, onMessage, onMessagesRead, onO
     }
   }, []);
 
-  // Setup WebSocket connection
+  // Subscribe to the chat on the shared user socket
   const setupWebSocket = useCallback(() => {
     if (!chatId || !token) return;
 
@@ -38,95 +43,63 @@ export function useChatWebSocket({ chatId, token, onMessage, onMessagesRead, onO
       return;
     }
 
-    if (ws.current?.readyState === WebSocket.OPEN) {
-      ws.current.close();
-    }
-
-    try {
-      setConnectionStatus('connecting');
-      const host = window.location.hostname;
-      const wsUrl = `ws://${host}:8000/ws/chat/${chatId}/?token=${token}`;
-
-      ws.current = new WebSocket(wsUrl);
-
-      ws.current.onopen = () => {
-        setConnectionStatus('connected');
-        wsRetryCount.current = 0;
-        onOpen?.();
-        onMessagesRead?.();
-      };
-
-      ws.current.onmessage = (event) => {
-        try {
-          const data = JSON.parse(event.data);
-          onMessage?.(data);
-        } catch (error) {
-          // Failed to parse WebSocket message
+    unsubscribeRef.current?.();
+    const socket = getUserSocket(token);
+    socketRef.current = socket;
+
+    statusUnsubscribeRef.current?.();
+    statusUnsubscribeRef.current = socket.onStatusChange((status) => {
+      setConnectionStatus(status);
+    });
+
+    // On reconnect the socket asks the server to replay only what arrived after our last message
+    unsubscribeRef.current = socket.subscribeChat(chatId, {
+      getLastSeq: () => callbacksRef.current.getLastSeq?.() || 0,
+      onFrame: (data) => {
+        const callbacks = callbacksRef.current;
+        if (data.type === 'init') {
+          callbacks.onOpen?.();
+          callbacks.onMessagesRead?.();
         }
-      };
-
-      ws.current.onclose = (e) => {
+        callbacks.onMessage?.(data);
+      },
+      onClosed: () => {
+        unsubscribeRef.current = null;
         setConnectionStatus('disconnected');
-
-        if (e.code !== WS_CODES.NORMAL_CLOSURE) {
-          const timeout = Math.min(
-            WS_CODES.RECONNECT_BASE_MS * 2 ** wsRetryCount.current,
-            INTERVALS.WS_MAX_RECONNECT_DELAY_MS
-          );
-          wsRetryCount.current += 1;
-
-          setTimeout(() => {
-            if (document.visibilityState === 'visible') {
-              setupWebSocketRef.current?.();
-            }
-          }, timeout);
-        }
-      };
-
-      ws.current.onerror = () => {
-        if (ws.current?.readyState !== WebSocket.CLOSED) {
-          setConnectionStatus('error');
-        }
-      };
-    } catch (error) {
-      console.error('WebSocket setup error:', error);
-      setConnectionStatus('error');
-    }
-  }, [chatId, token, isTokenExpired, onMessage, onMessagesRead, onOpen]);
+      },
+    });
+  }, [chatId, token, isTokenExpired]);
 
   // Store setup function in ref for reconnection
   setupWebSocketRef.current = setupWebSocket;
 
-  // Send a message through WebSocket
-  const sendMessage = useCallback((message) => {
-    if (ws.current?.readyState === WebSocket.OPEN) {
-      ws.current.send(JSON.stringify(message));
-      return true;
-    }
-    setConnectionStatus('error');
-    return false;
-  }, []);
-
-  // Close WebSocket connection
-  const close = useCallback((reason = 'Manual close') => {
-    if (ws.current) {
-      ws.current.close(WS_CODES.NORMAL_CLOSURE, reason);
-    }
+  // Send a frame to this chat over the shared socket
+  const sendMessage = useCallback(
+    (message) => {
+      if (socketRef.current?.sendToChat(chatId, message)) {
+        return true;
+      }
+      setConnectionStatus('error');
+      return false;
+    },
+    [chatId]
+  );
+
+  // Leave the chat; the shared socket stays open while anything else uses it
+  const close = useCallback(() => {
+    unsubscribeRef.current?.();
+    unsubscribeRef.current = null;
+    statusUnsubscribeRef.current?.();
+    statusUnsubscribeRef.current = null;
   }, []);
 
-  // Reconnect WebSocket
+  // Resubscribe, which also brings back a fresh init snapshot
   const reconnect = useCallback(() => {
     setupWebSocketRef.current?.();
   }, []);
 
   // Cleanup on unmount
-  useEffect(() => {
-    return () => {
-      if (ws.current) {
-        ws.current.close(WS_CODES.NORMAL_CLOSURE, 'Component unmounted');
-      }
-    };
-  }, []);
+  useEffect(() => close, [close]);
 
   return {
     connectionStatus,
@@ -1,6 +1,7 @@
 import { useState, useRef, useCallback, useEffect } from 'react';
 import axios from '../utils/axiosConfig';
 import { SWAPANZA, INTERVALS } from '../constants';
+import { getUserSocket } from '../utils/userSocket';
 
 /**
  * Custom hook to manage Swapanza state and timers
@@ -44,6 +45,9 @@ export function useSwapanza({
   const swapanzaTimeLeftRef = useRef(null);
   const timeLeftRef = useRef(null);
 
+  // State version the Swapanza state is current to (see utils/userSocket)
+  const stateVersionRef = useRef(null);
+
   // Keep timeLeftRef in sync with timeLeft state
   useEffect(() => {
     timeLeftRef.current = timeLeft;
@@ -303,38 +307,31 @@ export function useSwapanza({
     setRemainingMessages(isNaN(remaining) ? 0 : Math.max(0, remaining));
   }, []);
 
-  // Fetch global Swapanza state
-  const fetchGlobalSwapanzaState = useCallback(async () => {
-    if (!token) return;
-
-    try {
-      const response = await axios.get('/api/active-swapanza/', {
-        headers: { Authorization: `Bearer ${token}` },
-        params: { chat_id: chatId },
-      });
-
-      if (response.data.active) {
-        const startedAt = new Date(response.data.started_at);
-        const endsAt = new Date(response.data.ends_at);
+  // Apply the state reported by /api/active-swapanza/ or a swapanza.state push
+  const applySwapanzaState = useCallback(
+    (state) => {
+      if (state.active) {
+        const startedAt = new Date(state.started_at);
+        const endsAt = new Date(state.ends_at);
 
         setIsSwapanzaActive(true);
         setSwapanzaEndTime(endsAt);
         setSwapanzaStartTime(startedAt);
 
-        if (response.data.chat_specific_count !== undefined) {
-          setRemainingMessages(SWAPANZA.MESSAGE_LIMIT - response.data.chat_specific_count);
-        } else if (response.data.remaining_messages !== undefined) {
-          setRemainingMessages(response.data.remaining_messages);
+        if (state.chat_specific_count !== undefined) {
+          setRemainingMessages(SWAPANZA.MESSAGE_LIMIT - state.chat_specific_count);
+        } else if (state.remaining_messages !== undefined) {
+          setRemainingMessages(state.remaining_messages);
         }
 
         setSwapanzaPartner({
-          id: response.data.partner_id,
-          username: response.data.partner_username,
-          profile_image: response.data.partner_profile_image,
+          id: state.partner_id,
+          username: state.partner_username,
+          profile_image: state.partner_profile_image,
         });
 
-        const serverNow = response.data.server_time
-          ? new Date(response.data.server_time)
+        const serverNow = state.server_time
+          ? new Date(state.server_time)
           : new Date();
         const remainingSeconds = Math.max(0, Math.floor((endsAt - serverNow) / 1000));
 
@@ -351,25 +348,55 @@ export function useSwapanza({
       } else if (!chat?.swapanza_active && !pendingSwapanzaInvite && !isSwapanzaRequested) {
         resetSwapanza();
       }
-    } catch (error) {
-      // Failed to fetch Swapanza state
-    }
-  }, [
-    token,
-    chatId,
-    chat,
-    resetSwapanza,
-    setupSwapanzaTimer,
-    pendingSwapanzaInvite,
-    isSwapanzaRequested,
-  ]);
+    },
+    [chat, resetSwapanza, setupSwapanzaTimer, pendingSwapanzaInvite, isSwapanzaRequested]
+  );
+
+  // Fetch global Swapanza state; with ifChanged, only if it changed since the
+  // last fetch or push
+  const fetchGlobalSwapanzaState = useCallback(
+    async ({ ifChanged = false } = {}) => {
+      if (!token) return;
+
+      try {
+        const sinceVersion = ifChanged ? stateVersionRef.current : null;
+        const response = await axios.get('/api/active-swapanza/', {
+          headers: { Authorization: `Bearer ${token}` },
+          params: {
+            chat_id: chatId,
+            ...(sinceVersion !== null ? { since_version: sinceVersion } : {}),
+          },
+          validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+        });
 
-  // Poll for global Swapanza state
+        const version = response.headers['x-state-version'];
+        if (version !== undefined) stateVersionRef.current = Number(version);
+        if (response.status !== 304) applySwapanzaState(response.data);
+      } catch (error) {
+        // Failed to fetch Swapanza state
+      }
+    },
+    [token, chatId, applySwapanzaState]
+  );
+
+  // Load the Swapanza state, then follow the pushes on the user socket
   useEffect(() => {
+    if (!token) return undefined;
     fetchGlobalSwapanzaState();
-    const intervalId = setInterval(fetchGlobalSwapanzaState, INTERVALS.SWAPANZA_STATE_CHECK_MS);
-    return () => clearInterval(intervalId);
-  }, [fetchGlobalSwapanzaState]);
+
+    return getUserSocket(token).addListener((data) => {
+      if (data.type === 'state.gap') {
+        fetchGlobalSwapanzaState({ ifChanged: true });
+        return;
+      }
+      if (typeof data.version === 'number') {
+        stateVersionRef.current = data.version;
+      }
+      if (data.type === 'swapanza.state') {
+        applySwapanzaState(data.swapanza);
+      }
+    });
+  }, [token, fetchGlobalSwapanzaState, applySwapanzaState]);
 
   // Handle pending invite prop
   useEffect(() => {
@@ -0,0 +1,29 @@
+import axios from './axiosConfig';
+
+/**
+ * Startup state from /api/bootstrap/: profile, chats, unread counts, the
+ * active Swapanza and server time in one request.
+ *
+ * LoginForm fetches it right after getting a token and hands it over with
+ * `primeBootstrap`, so the chat list it navigates to starts without another
+ * round-trip. Later loads (a page reload) fetch it again.
+ */
+let primed = null;
+
+export function primeBootstrap(token, response) {
+  primed = { token, response };
+}
+
+/** The primed bootstrap response for `token`, or a fresh one */
+export async function loadBootstrap(token) {
+  const pending = primed;
+  primed = null;
+  if (pending && pending.token === token) {
+    return pending.response;
+  }
+  return axios.get('/api/bootstrap/', {
+    headers: { Authorization: `Bearer ${token}` },
+  });
+}
+
+export default loadBootstrap;
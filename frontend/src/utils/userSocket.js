@@ -0,0 +1,218 @@
+import { WS_CODES, INTERVALS } from '../constants';
+
+/**
+ * One WebSocket per user (ws/user/) carrying notifications and every open chat.
+ *
+ * Chats are subscribed in-band and their frames come back wrapped as
+ * `chat.frame`; everything else is a notification. The socket opens on first
+ * use, re-subscribes its chats with their last seen `seq` after reconnecting,
+ * and closes once nothing uses it.
+ *
+ * Unread and Swapanza frames carry the user's state `version`. Listeners get a
+ * `state.gap` frame whenever some may have been missed (on every (re)connect
+ * and when a version is skipped) and should then refetch with `since_version`.
+ */
+class UserSocket {
+  constructor(token) {
+    this.token = token;
+    this.ws = null;
+    this.status = 'disconnected';
+    this.chats = new Map();
+    this.listeners = new Set();
+    this.statusListeners = new Set();
+    this.retryCount = 0;
+    this.reconnectTimeout = null;
+    this.pingInterval = null;
+    this.pongTimeout = null;
+    this.closedByClient = false;
+    this.stateVersion = null;
+  }
+
+  setStatus(status) {
+    this.status = status;
+    this.statusListeners.forEach((listener) => listener(status));
+  }
+
+  connect() {
+    if (this.ws && this.ws.readyState <= WebSocket.OPEN) return;
+    this.closedByClient = false;
+    clearTimeout(this.reconnectTimeout);
+    this.setStatus('connecting');
+
+    const host = window.location.hostname;
+    const ws = new WebSocket(`ws://${host}:8000/ws/user/?token=${this.token}`);
+    this.ws = ws;
+
+    ws.onopen = () => {
+      if (this.ws !== ws) return;
+      this.retryCount = 0;
+      this.setStatus('connected');
+      this.chats.forEach((_, chatId) => this.sendSubscribe(chatId));
+      this.startPing();
+      this.stateVersion = null;
+      this.notify({ type: 'state.gap' });
+    };
+
+    ws.onmessage = (event) => {
+      if (this.ws !== ws) return;
+      let data;
+      try {
+        data = JSON.parse(event.data);
+      } catch (error) {
+        return;
+      }
+
+      if (data.type === 'pong') {
+        clearTimeout(this.pongTimeout);
+      } else if (data.type === 'chat.frame') {
+        this.chats.get(data.chat_id)?.onFrame?.(data.frame);
+      } else if (data.type === 'chat.closed') {
+        // Closed by the server (unknown chat, Swapanza logout): don't resubscribe
+        const handlers = this.chats.get(data.chat_id);
+        if (handlers && data.code !== WS_CODES.NORMAL_CLOSURE) {
+          this.chats.delete(data.chat_id);
+          handlers.onClosed?.(data.code);
+        }
+      } else {
+        if (typeof data.version === 'number') {
+          if (this.stateVersion !== null && data.version > this.stateVersion + 1) {
+            this.notify({ type: 'state.gap' });
+          }
+          this.stateVersion = data.version;
+        }
+        this.notify(data);
+      }
+    };
+
+    ws.onclose = (e) => {
+      if (this.ws !== ws) return;
+      this.stopPing();
+      this.ws = null;
+      this.setStatus('disconnected');
+      if (this.closedByClient || e.code === WS_CODES.NORMAL_CLOSURE) return;
+
+      const timeout = Math.min(
+        WS_CODES.RECONNECT_BASE_MS * 2 ** this.retryCount,
+        INTERVALS.WS_MAX_RECONNECT_DELAY_MS
+      );
+      this.retryCount += 1;
+      this.reconnectTimeout = setTimeout(() => this.connect(), timeout);
+    };
+
+    ws.onerror = () => {
+      // Reconnection is handled in onclose
+    };
+  }
+
+  /** Reconnect with a refreshed token, keeping every subscription */
+  setToken(token) {
+    if (token === this.token) return;
+    this.token = token;
+    if (!this.ws) return;
+    const ws = this.ws;
+    this.ws = null;
+    this.stopPing();
+    ws.close(WS_CODES.NORMAL_CLOSURE, 'Token refreshed');
+    this.connect();
+  }
+
+  notify(data) {
+    this.listeners.forEach((listener) => listener(data));
+  }
+
+  startPing() {
+    this.stopPing();
+    this.pingInterval = setInterval(() => {
+      if (!this.send({ type: 'ping' })) return;
+      this.pongTimeout = setTimeout(() => {
+        console.warn('No pong received in 45s');
+        this.ws?.close(3000, 'No pong received');
+      }, 45000);
+    }, 60000);
+  }
+
+  stopPing() {
+    clearInterval(this.pingInterval);
+    clearTimeout(this.pongTimeout);
+  }
+
+  send(frame) {
+    if (this.ws?.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify(frame));
+      return true;
+    }
+    return false;
+  }
+
+  sendSubscribe(chatId) {
+    const lastSeq = this.chats.get(chatId)?.getLastSeq?.() || 0;
+    this.send({ type: 'subscribe', chat_id: chatId, ...(lastSeq ? { last_seq: lastSeq } : {}) });
+  }
+
+  /** Open a chat stream; returns a function that closes it */
+  subscribeChat(chatId, handlers) {
+    const id = Number(chatId);
+    this.chats.set(id, handlers);
+    if (this.status === 'connected') {
+      this.sendSubscribe(id);
+    } else {
+      this.connect();
+    }
+
+    return () => {
+      if (this.chats.get(id) !== handlers) return;
+      this.chats.delete(id);
+      this.send({ type: 'unsubscribe', chat_id: id });
+      this.closeIfUnused();
+    };
+  }
+
+  sendToChat(chatId, frame) {
+    return this.send({ ...frame, chat_id: Number(chatId) });
+  }
+
+  /** Receive notification frames; returns a function that stops listening */
+  addListener(listener) {
+    this.listeners.add(listener);
+    this.connect();
+    return () => {
+      this.listeners.delete(listener);
+      this.closeIfUnused();
+    };
+  }
+
+  onStatusChange(listener) {
+    this.statusListeners.add(listener);
+    listener(this.status);
+    return () => this.statusListeners.delete(listener);
+  }
+
+  closeIfUnused() {
+    if (this.chats.size || this.listeners.size) return;
+    this.close();
+  }
+
+  close() {
+    this.closedByClient = true;
+    clearTimeout(this.reconnectTimeout);
+    this.stopPing();
+    const ws = this.ws;
+    this.ws = null;
+    ws?.close(WS_CODES.NORMAL_CLOSURE, 'Manual close');
+    this.setStatus('disconnected');
+  }
+}
+
+let userSocket = null;
+
+/** The shared socket, switched over to `token` if it was opened with another one */
+export function getUserSocket(token) {
+  if (!userSocket) {
+    userSocket = new UserSocket(token);
+  } else {
+    userSocket.setToken(token);
+  }
+  return userSocket;
+}
+
+export default getUserSocket;